@@ -6,7 +6,6 @@ import sys
 from pathlib import Path
 
 from sarand.__init__ import __version__
-from sarand.full_pipeline import full_pipeline_main
 from sarand.util.logger import create_logger, get_logger
 from sarand.util.pkg import get_pkg_card_fasta_path
 from sarand.utils import assert_dependencies_exist, check_file, validate_range
@@ -194,7 +193,9 @@ def main():
     # logging file
     log.info(f"Sarand initialized: output={args.output_dir}")
 
-    # execute main workflow
+    # execute main workflow, the pipeline (and its plotting / graph dependencies)
+    # is only imported here so that --help, --version and bad arguments return quickly
+    from sarand.full_pipeline import full_pipeline_main
     full_pipeline_main(args)
 
 
@@ -0,0 +1,2 @@
+class SarandPipelineError(RuntimeError):
+    """Raised when a step of the sarand pipeline cannot continue."""
@@ -5,6 +5,7 @@ from pathlib import Path
 from typing import Optional, List
 
 from sarand.config import PROGRAM_VERSION_NA, CONDA_BAKTA_NAME, CONDA_EXE_NAME, CONDA_BAKTA_DB
+from sarand.model.gene_info import GeneInfo
 from sarand.util.logger import LOG
 
 
@@ -23,6 +24,50 @@ class BaktaParams:
         'skip_plot', 'verbose', 'debug', 'threads', 'tmp_dir', 'genome'
     )
 
+    # (attribute, command line flag, kind) in the order they are written,
+    # kind is one of 'flag' (no argument), 'path' (absolute path) or 'value'
+    _OPTS = (
+        ('db', '--db', 'path'),
+        ('min_contig_length', '--min-contig-length', 'value'),
+        ('prefix', '--prefix', 'value'),
+        ('output', '--output', 'path'),
+
+        ('genus', '--genus', 'value'),
+        ('species', '--species', 'value'),
+        ('strain', '--strain', 'value'),
+        ('plasmid', '--plasmid', 'value'),
+
+        ('complete', '--complete', 'flag'),
+        ('prodigal_tf', '--prodigal-tf', 'path'),
+        ('translation_table', '--translation-table', 'value'),
+        ('gram', '--gram', 'value'),
+        ('locus', '--locus', 'value'),
+        ('locus_tag', '--locus-tag', 'value'),
+        ('keep_contig_headers', '--keep-contig-headers', 'flag'),
+        ('replicons', '--replicons', 'path'),
+        ('compliant', '--compliant', 'flag'),
+        ('proteins', '--proteins', 'path'),
+        ('meta', '--meta', 'flag'),
+
+        ('skip_trna', '--skip-trna', 'flag'),
+        ('skip_tmrna', '--skip-tmrna', 'flag'),
+        ('skip_rrna', '--skip-rrna', 'flag'),
+        ('skip_ncrna', '--skip-ncrna', 'flag'),
+        ('skip_ncrna_region', '--skip-ncrna-region', 'flag'),
+        ('skip_crispr', '--skip-crispr', 'flag'),
+        ('skip_cds', '--skip-cds', 'flag'),
+        ('skip_pseudo', '--skip-pseudo', 'flag'),
+        ('skip_sorf', '--skip-sorf', 'flag'),
+        ('skip_gap', '--skip-gap', 'flag'),
+        ('skip_ori', '--skip-ori', 'flag'),
+        ('skip_plot', '--skip-plot', 'flag'),
+
+        ('verbose', '--verbose', 'flag'),
+        ('debug', '--debug', 'flag'),
+        ('threads', '--threads', 'value'),
+        ('tmp_dir', '--tmp-dir', 'path'),
+    )
+
     def __init__(
             self, genome: Path,
             db: Optional[Path] = None,
@@ -173,82 +218,16 @@ class BaktaParams:
 
     def as_cmd(self) -> List[str]:
         cmd: List[str] = ['bakta']
-
-        if self.db:
-            cmd += ["--db", str(self.db.absolute())]
-        if self.min_contig_length:
-            cmd += ["--min-contig-length", str(self.min_contig_length)]
-        if self.prefix:
-            cmd += ["--prefix", str(self.prefix)]
-        if self.output:
-            cmd += ["--output", str(self.output.absolute())]
-
-        if self.genus:
-            cmd += ["--genus", str(self.genus)]
-        if self.species:
-            cmd += ["--species", str(self.species)]
-        if self.strain:
-            cmd += ["--strain", str(self.strain)]
-        if self.plasmid:
-            cmd += ["--plasmid", str(self.plasmid)]
-
-        if self.complete:
-            cmd += ["--complete"]
-        if self.prodigal_tf:
-            cmd += ["--prodigal-tf", str(self.prodigal_tf.absolute())]
-        if self.translation_table:
-            cmd += ["--translation-table", str(self.translation_table)]
-        if self.gram:
-            cmd += ["--gram", str(self.gram)]
-        if self.locus:
-            cmd += ["--locus", str(self.locus)]
-        if self.locus_tag:
-            cmd += ["--locus-tag", str(self.locus_tag)]
-        if self.keep_contig_headers:
-            cmd += ["--keep-contig-headers"]
-        if self.replicons:
-            cmd += ["--replicons", str(self.replicons.absolute())]
-        if self.compliant:
-            cmd += ["--compliant"]
-        if self.proteins:
-            cmd += ["--proteins", str(self.proteins.absolute())]
-        if self.meta:
-            cmd += ["--meta"]
-
-        if self.skip_trna:
-            cmd += ["--skip-trna"]
-        if self.skip_tmrna:
-            cmd += ["--skip-tmrna"]
-        if self.skip_rrna:
-            cmd += ["--skip-rrna"]
-        if self.skip_ncrna:
-            cmd += ["--skip-ncrna"]
-        if self.skip_ncrna_region:
-            cmd += ["--skip-ncrna-region"]
-        if self.skip_crispr:
-            cmd += ["--skip-crispr"]
-        if self.skip_cds:
-            cmd += ["--skip-cds"]
-        if self.skip_pseudo:
-            cmd += ["--skip-pseudo"]
-        if self.skip_sorf:
-            cmd += ["--skip-sorf"]
-        if self.skip_gap:
-            cmd += ["--skip-gap"]
-        if self.skip_ori:
-            cmd += ["--skip-ori"]
-        if self.skip_plot:
-            cmd += ["--skip-plot"]
-
-        if self.verbose:
-            cmd += ["--verbose"]
-        if self.debug:
-            cmd += ["--debug"]
-        if self.threads:
-            cmd += ["--threads", str(self.threads)]
-        if self.tmp_dir:
-            cmd += ["--tmp-dir", str(self.tmp_dir.absolute())]
-
+        for name, flag, kind in self._OPTS:
+            value = getattr(self, name)
+            if not value:
+                continue
+            if kind == 'flag':
+                cmd.append(flag)
+            elif kind == 'path':
+                cmd += [flag, str(value.absolute())]
+            else:
+                cmd += [flag, str(value)]
         cmd.append(str(self.genome.absolute()))
         return cmd
 
@@ -260,36 +239,28 @@ class BaktaResult:
         self.data: dict = data
 
     def get_for_sarand(self):
-        out = list()
-
         """
         AM: The sequence can also be obtained from the self.data method if needed.
+
+        AM:
+        - The Locus tag is different from Prokka
+        - Length is off by 1, this is either due to exclusive bounds, or from Bandage?
+        - Product name is different (more verbose than prokka)
+        - The stop/start are flipped for reverse strand as per the previous implementation
         """
-        for feature in self.data['features']:
-            """
-            AM:
-            - The Locus tag is different from Prokka
-            - Length is off by 1, this is either due to exclusive bounds, or from Bandage?
-            - Product name is different (more verbose than prokka)
-            - The stop/start are flipped for reverse strand as per the previous implementation
-            """
-            out.append({
-                "locus_tag": feature.get('locus'),
-                "gene": feature.get('gene') or '',  # AM: This matches the expected output
-                "length": str((feature['stop'] - feature['start']) + 1),
+        return [
+            GeneInfo(
+                locus_tag=feature.get('locus'),
+                gene=feature.get('gene') or '',  # AM: This matches the expected output
+                length=str((feature['stop'] - feature['start']) + 1),
                 # AM: This matches the expected output but should probably remain int
-                "product": feature['product'],
-                "start_pos": feature['start'] if feature['strand'] == '+' else feature['stop'],
-                "end_pos": feature['stop'] if feature['strand'] == '+' else feature['start'],
-                # "prokka_gene_name": 'TO REMOVE',
-                "RGI_prediction_type": None,
-                "coverage": None,
-                "family": None,
-                "seq_value": None,
-                "seq_name": None,
-                "target_amr": None,
-            })
-        return out
+                product=feature['product'],
+                start_pos=feature['start'] if feature['strand'] == '+' else feature['stop'],
+                end_pos=feature['stop'] if feature['strand'] == '+' else feature['start'],
+                # prokka_gene_name='TO REMOVE',
+            )
+            for feature in self.data['features']
+        ]
 
 
 class Bakta:
@@ -324,7 +295,7 @@ class Bakta:
         return cls(params, result)
 
     @classmethod
-    def run_for_sarand(cls, genome: Path, prefix: str, out_dir: Path):
+    def run_for_sarand(cls, genome: Path, prefix: str, out_dir: Path, threads: Optional[int] = None):
         params = BaktaParams(
             db=Path(CONDA_BAKTA_DB) if CONDA_BAKTA_DB else None,
             genome=genome,
@@ -332,6 +303,7 @@ class Bakta:
             meta=True,
             skip_trna=True,
             output=out_dir,
+            threads=threads,
         )
         return cls.run(params)
 
@@ -136,14 +136,27 @@ class Blastn:
         return cls(params, results)
 
     @classmethod
-    def run_for_sarand_compare_two_sequences(cls, query: Path, subject: Path):
-        """Special implementation for sarand compare two sequences."""
+    def run_for_sarand_compare_two_sequences(
+            cls,
+            query: Path,
+            subject: Path,
+            task: str = 'blastn-short',
+            evalue: Optional[float] = None,
+            max_target_seqs: Optional[int] = None,
+    ):
+        """Special implementation for sarand compare two sequences.
+
+        The defaults reproduce the original blastn-short call, the identity
+        and coverage thresholds are applied by the caller on the results.
+        """
 
         params = BlastnParams(
             query=query,
             subject=subject,
-            task='blastn-short',
+            task=task,
             outfmt=BlastnOutFmt.FMT_1,
+            evalue=evalue,
+            max_target_seqs=max_target_seqs,
         )
         return Blastn.run(params)
 
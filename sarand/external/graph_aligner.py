@@ -1,6 +1,7 @@
 import re
 import subprocess
 import tempfile
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, List, Union, Dict
 
@@ -9,6 +10,7 @@ from sarand.util.logger import LOG
 
 _RE_VERSION = re.compile(r'(\d+\.\d+\.\d+[-\w]*)')
 _RE_RECORD_CLIP = re.compile(r'(.*)_(\d+)_(\d+)_(\d+)$')
+_RE_PATH_NODE = re.compile(r'([><])(\d+)')
 
 
 class GraphAlignerParams:
@@ -323,7 +325,7 @@ class GraphAlignerResult:
         """
         AM: GAF files from GraphAligner displays > as + and < as -
         """
-        hits = re.findall(r'([><])(\d+)', self.path)
+        hits = _RE_PATH_NODE.findall(self.path)
         if len(hits) == 0:
             raise Exception('??')
         nodes = list()
@@ -352,6 +354,7 @@ class GraphAlignerResult:
         return GraphAlignerResult.restricted_amr_name_from_modified_name(amr_str)
 
     @staticmethod
+    @lru_cache(maxsize=None)
     def restricted_amr_name_from_modified_name(amr_name):
         """Lifted from utils to avoid circular imports
         TODO: Refactor utils to avoid calls to GraphAligner?
@@ -112,6 +112,8 @@ class RgiResult:
             for row in rgi_reader:
                 seq_info = {
                     "ORF_ID": row[0],
+                    # the locus tag of the ORF, i.e. without the description
+                    "ORF_key": row[0].split(" ", 1)[0],
                     "gene": row[8].strip(),
                     "prediction_type": row[5].strip(),
                     "best_identities": float(row[9]),
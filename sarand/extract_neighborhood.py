@@ -14,7 +14,6 @@ To run:
 
 ################################################################################
 
-import sys
 import os
 import tempfile
 
@@ -22,11 +21,11 @@ import gfapy
 import datetime
 import csv
 import subprocess
-from gfapy.sequence import rc
 import shutil
 import multiprocessing
-from csv import DictReader
 
+from sarand.exceptions import SarandPipelineError
+from sarand.util.file import ensure_dir
 from sarand.util.logger import LOG
 from sarand.utils import (
     reverse_sign,
@@ -39,6 +38,36 @@ from sarand.utils import (
 OUT_DIR = "output"
 TEMP_DIR = "temp"
 
+# the bracket marking the other end of an AMR path "[ ]" or a loop "{ }"
+_REVERSED_BRACKETS = {"[": "]", "]": "[", "{": "}", "}": "{"}
+
+# Watson-Crick complements of the IUPAC alphabet (case preserved), the same
+# mapping as gfapy.sequence.rc
+_COMPLEMENT_TABLE = str.maketrans(
+    "ACGTUBVHDRYKMSWNacgtubvhdrykmswn-.=",
+    "TGCAAVBDHYRMKSWNtgcaavbdhyrmkswn-.=",
+)
+_COMPLEMENT_CHARS = frozenset("ACGTUBVHDRYKMSWNacgtubvhdrykmswn-.=")
+
+# the graphs loaded by load_gfa, keyed by file
+_GFA_CACHE = dict()
+
+
+def rc(seq):
+    """
+    To return the reverse complement of a sequence
+    Parameters:
+            seq:	the original sequence
+    Return: the reverse complement of seq; placeholders ("*") are returned unchanged
+    Raises: gfapy.ValueError if seq has a character with no complement (as gfapy.sequence.rc)
+    """
+    if gfapy.is_placeholder(seq):
+        return seq
+    if not _COMPLEMENT_CHARS.issuperset(seq):
+        invalid = next(c for c in seq if c not in _COMPLEMENT_CHARS)
+        raise gfapy.ValueError(f"{seq}: no Watson-Crick complement for {invalid}")
+    return seq.translate(_COMPLEMENT_TABLE)[::-1]
+
 
 """
 AM: This is never used.
@@ -90,12 +119,11 @@ def write_sequences_to_file(sequence_list, path_list, file_name):
             path_list: the list of all paths (a list of nodes) in AMR gene neighborhood
             file_name: the name of file to be writtn in
     """
-    file = open(file_name, "a+")
-    for seq, path in zip(sequence_list, path_list):
-        myLine = "> " + ", ".join(path) + ":"
-        file.write(myLine + "\n")
-        file.write(seq + "\n")
-    file.close()
+    with open(file_name, "a+") as file:
+        file.writelines(
+            "> " + ", ".join(path) + ":\n" + seq + "\n"
+            for seq, path in zip(sequence_list, path_list)
+        )
 
 
 def sequence_on_orientation(seq, orient):
@@ -234,14 +262,12 @@ def reverse_path(path):
             e.g., [1+, [8-, 12+], 9-] --> [9+, [12-, 8+,] 1-]
     """
     mypath = []
-    items = ["[", "]", "{", "}"]
-    reversed_items = ["]", "[", "}", "{"]
     for node in reversed(path):
         mynode = ""
         num = ""
         for ch in node:
-            if ch in items:
-                mynode = reversed_items[items.index(ch)] + mynode
+            if ch in _REVERSED_BRACKETS:
+                mynode = _REVERSED_BRACKETS[ch] + mynode
             elif ch == "-" or ch == "+":
                 num += reverse_sign(ch)
                 mynode = num + mynode
@@ -268,10 +294,7 @@ def extract_found_amr(myGraph, node_list, orientation_list, start_pos, end_pos):
     """
     if not node_list:
         LOG.error("ERROR: There is no node in node_list representing the AMR gene!")
-        import pdb
-
-        pdb.set_trace()
-        sys.exit()
+        raise SarandPipelineError("There is no node in node_list representing the AMR gene!")
 
     if len(node_list) == 1:
         return sequence_on_orientation(
@@ -393,15 +416,18 @@ def generate_sequence_path(
         sequence_list = []
         counter = 0
         path_info_list = []
+        # change the case of each sequence once rather than for every pair
+        found_amr_seq = found_amr_seq.lower()
+        pre_sequence_list = [seq.upper() for seq in pre_sequence_list]
+        post_sequence_list = [seq.upper() for seq in post_sequence_list]
         for pre_seq, pre_path in zip(pre_sequence_list, pre_path_list):
+            pre_amr_seq = pre_seq + found_amr_seq
             for post_seq, post_path in zip(post_sequence_list, post_path_list):
                 if path_dir == "same":
-                    sequence = pre_seq.upper() + found_amr_seq.lower() + post_seq.upper()
+                    sequence = pre_amr_seq + post_seq
                     path = pre_path + node_orient_list + post_path
                 elif path_dir == "reverse":
-                    sequence = rc(
-                        pre_seq.upper() + found_amr_seq.lower() + post_seq.upper()
-                    )
+                    sequence = rc(pre_amr_seq + post_seq)
                     path = reverse_path(pre_path + node_orient_list + post_path)
                 index, found = similar_sequence_exits(sequence_list, sequence, temp_dir)
                 if not found:
@@ -445,16 +471,52 @@ def append_path_sequence(
         path_length_list[index] = path_length
         # change corresponding entry in temp file
         if sequence != "":
-            r = csv.reader(open(outfile))
-            lines = list(r)
+            with open(outfile) as fd:
+                lines = list(csv.reader(fd))
             # lines[0] contains the headers
             lines[index + 1] = [str(index), str(sequence), str(path), str(path_length)]
-            writer = csv.writer(open(outfile, "w"))
-            writer.writerows(lines)
+            with open(outfile, "w") as fd:
+                csv.writer(fd).writerows(lines)
 
     return sequence_list, path_list, path_length_list
 
 
+def read_temp_result(temp_result, prefix, sequence_list, path_list, path_length_list):
+    """
+    To read the sequences, paths and path lengths stored in the temp file by
+    extract_post_sequence_recursively_both_dir or extract_pre_sequence_recursively_both_dir
+    Parameters:
+            temp_result: the address of the temp file
+            prefix: the prefix of the columns in the temp file ('pre' or 'post')
+            sequence_list: the list to add the sequences to
+            path_list: the list to add the paths to
+            path_length_list: the list to add the lengths of nodes in the paths to
+    """
+    with open(temp_result, newline="") as fd:
+        reader = csv.reader(fd)
+        # the columns are: index, <prefix>_seq, <prefix>_path, <prefix>_path_len
+        header = next(reader, None)
+        if header is None:
+            return
+        seq_idx = header.index(prefix + "_seq")
+        path_idx = header.index(prefix + "_path")
+        path_len_idx = header.index(prefix + "_path_len")
+        for row in reader:
+            if not row:
+                continue
+            sequence_list.append(row[seq_idx])
+            path_str = row[path_idx]
+            if path_str != "[]":
+                path = [a.strip("'") for a in path_str[1:-1].split(", ")]
+            else:
+                path = []
+            path_list.append(path)
+            path_length = [
+                int(l) for l in row[path_len_idx][1:-1].split(",") if l.strip() != ""
+            ]
+            path_length_list.append(path_length)
+
+
 def extract_post_sequence_recursively_both_dir(
     node,
     node_orient,
@@ -700,30 +762,21 @@ def extract_post_sequence(
             # p.kill()
             p.join()
         # Read the result from temp file
-        with open(temp_result) as fd:
-            myreader = DictReader(fd)
-            for row in myreader:
-                post_sequence_list.append(row["post_seq"])
-                if row["post_path"] != "[]":
-                    path = [a.strip("'") for a in row["post_path"][1:-1].split(", ")]
-                else:
-                    path = []
-                post_path_list.append(path)
-                path_length = [
-                    int(l.strip())
-                    for l in row["post_path_len"][1:-1].split(",")
-                    if l.strip() != ""
-                ]
-                path_length_list.append(path_length)
+        read_temp_result(
+            temp_result, "post", post_sequence_list, post_path_list, path_length_list
+        )
         # delete temp file
-        if os.path.isfile(temp_result):
+        try:
             os.remove(temp_result)
+        except FileNotFoundError:
+            pass
         # delete the temp folder
-        if os.path.exists(compare_dir):
-            try:
-                shutil.rmtree(compare_dir)
-            except OSError as e:
-                LOG.error("Error: %s - %s." % (e.filename, e.strerror))
+        try:
+            shutil.rmtree(compare_dir)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            LOG.error("Error: %s - %s." % (e.filename, e.strerror))
 
     return post_sequence_list, post_path_list, path_length_list
 
@@ -978,30 +1031,21 @@ def extract_pre_sequence(
             # p.kill()
             p.join()
         # Read the result from temp file
-        with open(temp_result) as fd:
-            myreader = DictReader(fd)
-            for row in myreader:
-                pre_sequence_list.append(row["pre_seq"])
-                if row["pre_path"] != "[]":
-                    path = [a.strip("'") for a in row["pre_path"][1:-1].split(", ")]
-                else:
-                    path = []
-                pre_path_list.append(path)
-                path_length = [
-                    int(l.strip())
-                    for l in row["pre_path_len"][1:-1].split(",")
-                    if l.strip() != ""
-                ]
-                path_length_list.append(path_length)
+        read_temp_result(
+            temp_result, "pre", pre_sequence_list, pre_path_list, path_length_list
+        )
         # delete temp file
-        if os.path.isfile(temp_result):
+        try:
             os.remove(temp_result)
+        except FileNotFoundError:
+            pass
         # delete the temp folder
-        if os.path.exists(compare_dir):
-            try:
-                shutil.rmtree(compare_dir)
-            except OSError as e:
-                LOG.error("Error: %s - %s." % (e.filename, e.strerror))
+        try:
+            shutil.rmtree(compare_dir)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            LOG.error("Error: %s - %s." % (e.filename, e.strerror))
 
     return pre_sequence_list, pre_path_list, path_length_list
 
@@ -1009,20 +1053,21 @@ def extract_pre_sequence(
 def write_paths_info_to_file(paths_info_list, paths_info_file, seq_counter):
     """ """
     counter = seq_counter
+    rows = []
+    for i, path_info in enumerate(paths_info_list):
+        for node_info in path_info:
+            counter = i + seq_counter + 1
+            rows.append(
+                [
+                    counter,
+                    node_info["node"],
+                    node_info["coverage"],
+                    node_info["start"],
+                    node_info["end"],
+                ]
+            )
     with open(paths_info_file, "a") as fd:
-        writer = csv.writer(fd)
-        for i, path_info in enumerate(paths_info_list):
-            for node_info in path_info:
-                counter = i + seq_counter + 1
-                writer.writerow(
-                    [
-                        counter,
-                        node_info["node"],
-                        node_info["coverage"],
-                        node_info["start"],
-                        node_info["end"],
-                    ]
-                )
+        csv.writer(fd).writerows(rows)
     return counter
 
 
@@ -1046,10 +1091,9 @@ def calculate_coverage(segment, max_kmer_size, node, assembler):
         LOG.error(
             "no way of calculating node coverage has been defined for this assembler!"
         )
-        import pdb
-
-        pdb.set_trace()
-        sys.exit()
+        raise SarandPipelineError(
+            "No way of calculating node coverage has been defined for " + assembler
+        )
     return coverage
 
 
@@ -1092,12 +1136,23 @@ def generate_node_range_coverage(
         pre_path_length_list = [[]]
     if not post_path_length_list:
         post_path_length_list = [[]]
+
+    # the coverage of a node is calculated once and shared by all paths visiting it
+    node_coverage = {}
+
+    def get_coverage(node):
+        if node not in node_coverage:
+            node_coverage[node] = calculate_coverage(
+                myGraph.segment(node), max_kmer_size, node, assembler
+            )
+        return node_coverage[node]
+
     # find amr_path_length_info
     start = 0
     amr_path_length_info = []
     for i, node in enumerate(node_list):
         segment = myGraph.segment(node)
-        coverage = calculate_coverage(segment, max_kmer_size, node, assembler)
+        coverage = get_coverage(node)
         # the length of first node in amr
         if i == 0 and len(node_list) == 1:
             length = end_pos - start_pos + 1
@@ -1142,24 +1197,18 @@ def generate_node_range_coverage(
         end_common = len(path_length) - difference
         for node, length in zip(path, path_length[:end_common]):
             pure_node = find_node_name(node)
-            segment = myGraph.segment(pure_node)
-            coverage = calculate_coverage(segment, max_kmer_size, pure_node, assembler)
             node_info = {
                 "node": pure_node,
-                "coverage": coverage,
+                "coverage": get_coverage(pure_node),
                 "start": start,
                 "end": start + length - 1,
             }
             start = start + length
             pre_path_info.append(node_info)
         if len(path) == len(path_length) - 1:
-            segment = myGraph.segment(node_list[0])
-            coverage = calculate_coverage(
-                segment, max_kmer_size, node_list[0], assembler
-            )
             node_info_last = {
                 "node": node_list[0],
-                "coverage": coverage,
+                "coverage": get_coverage(node_list[0]),
                 "start": start,
                 "end": start + path_length[-1] - 1,
             }
@@ -1188,13 +1237,9 @@ def generate_node_range_coverage(
         ), "inconsistent length of arrays: path vs path_length"
         start_index = len(path_length) - len(path)
         if len(path) == len(path_length) - 1:
-            segment = myGraph.segment(node_list[-1])
-            coverage = calculate_coverage(
-                segment, max_kmer_size, node_list[-1], assembler
-            )
             node_info = {
                 "node": node_list[-1],
-                "coverage": coverage,
+                "coverage": get_coverage(node_list[-1]),
                 "start": start,
                 "end": start + path_length[0] - 1,
             }
@@ -1202,11 +1247,9 @@ def generate_node_range_coverage(
             start = start + path_length[0]
         for node, length in zip(path, path_length[start_index:]):
             pure_node = find_node_name(node)
-            segment = myGraph.segment(pure_node)
-            coverage = calculate_coverage(segment, max_kmer_size, pure_node, assembler)
             node_info = {
                 "node": pure_node,
-                "coverage": coverage,
+                "coverage": get_coverage(pure_node),
                 "start": start,
                 "end": start + length - 1,
             }
@@ -1234,7 +1277,7 @@ def generate_node_range_coverage(
 
 
 def extract_neighborhood_sequence(
-    gfa_file,
+    myGraph,
     length,
     amr_path_info,
     path_thr,
@@ -1266,17 +1309,6 @@ def extract_neighborhood_sequence(
             the list of extracted sequences and paths (the nodes representing the sequence)
                     and their info as well as modified seq_info
     """
-    try:
-        LOG.debug(f"Loading the graph from {gfa_file}...")
-        myGraph = gfapy.Gfa.from_file(gfa_file)
-    except Exception as e:
-        LOG.error("Graph not loaded successfully: " + str(e))
-        if assembler == "metacherchant":
-            return [], [], [], []
-        else:
-            import pdb
-
-            pdb.set_trace()
     node_list = amr_path_info["nodes"]
     orientation_list = amr_path_info["orientations"]
     start_pos = amr_path_info["start_pos"]
@@ -1484,9 +1516,9 @@ def check_if_similar_ng_extractions_exist(
             LOG.error(
                 "there shouldnt be two separate amr paths with the same single node!"
             )
-            import pdb
-
-            pdb.set_trace()
+            raise SarandPipelineError(
+                "There shouldn't be two separate amr paths with the same single node!"
+            )
         if (
             new_first_node == first_node
             and new_start_pos == start_pos
@@ -1663,6 +1695,40 @@ AM: This method is not used anywhere.
 #     return path_nodes
 
 
+def load_gfa(gfa_file):
+    """
+    To load an assembly graph; each graph is only loaded once per process as
+    it's not modified by the extraction
+    Parameters:
+        gfa_file: the GFA file containing the assembly graph
+    Return:
+        the loaded graph
+    """
+    key = str(gfa_file)
+    graph = _GFA_CACHE.get(key)
+    if graph is None:
+        LOG.debug(f"Loading the graph from {key}...")
+        graph = gfapy.Gfa.from_file(key)
+        _GFA_CACHE[key] = graph
+    return graph
+
+
+def preload_gfa(gfa_file):
+    """
+    To load an assembly graph when a worker process starts (used as the initializer
+    of the extraction pool); any error is raised again when extracting
+    """
+    try:
+        load_gfa(gfa_file)
+    except Exception as e:
+        LOG.error("Graph not loaded successfully: " + str(e))
+
+
+def clear_gfa_cache():
+    """To release the graphs loaded by load_gfa"""
+    _GFA_CACHE.clear()
+
+
 def neighborhood_sequence_extraction(
     gfa_file,
     length,
@@ -1702,7 +1768,7 @@ def neighborhood_sequence_extraction(
     LOG.debug("amr_file = " + amr_file)
     output_name = seq_name_prefix + os.path.splitext(os.path.basename(amr_file))[0]
     seq_output_dir = os.path.join(output_dir, "sequences")
-    os.makedirs(seq_output_dir, exist_ok=True)
+    ensure_dir(seq_output_dir)
 
     seq_file = os.path.join(
         seq_output_dir,
@@ -1715,7 +1781,7 @@ def neighborhood_sequence_extraction(
     )
 
     if not amr_paths_info:
-        os.makedirs(os.path.join(output_dir, "alignment_files"), exist_ok=True)
+        ensure_dir(os.path.join(output_dir, "alignment_files"))
         # remained_len_thr = length - (length*path_seq_len_percent_threshod/100.0)
         # find all AMR paths in the assembly graph
         """
@@ -1735,7 +1801,7 @@ def neighborhood_sequence_extraction(
             return "", ""
 
     # csv file for path_info
-    os.makedirs(os.path.join(output_dir, "paths_info"), exist_ok=True)
+    ensure_dir(os.path.join(output_dir, "paths_info"))
     paths_info_file = os.path.join(
         output_dir,
         "paths_info",
@@ -1746,10 +1812,26 @@ def neighborhood_sequence_extraction(
         + datetime.datetime.now().strftime("%Y-%m-%d_%H-%M")
         + ".csv",
     )
-    with open(paths_info_file, "a") as fd:
+    # start both files afresh, appending to the files of an earlier extraction
+    # of this AMR (named by the minute) duplicated all of their rows
+    try:
+        os.remove(seq_file)
+    except FileNotFoundError:
+        pass
+    with open(paths_info_file, "w") as fd:
         writer = csv.writer(fd)
         writer.writerow(["sequence", "node", "coverage", "start", "end"])
 
+    # Load the graph once, it is shared by all AMR paths (and AMRs in this process)
+    try:
+        myGraph = load_gfa(gfa_file)
+    except Exception as e:
+        LOG.error("Graph not loaded successfully: " + str(e))
+        if assembler == "metacherchant":
+            return seq_file, paths_info_file
+        else:
+            raise SarandPipelineError("Graph not loaded successfully: " + str(e)) from e
+
     # Extract the sequenc of AMR neighborhood
     LOG.debug(f"Calling extract_neighborhood_sequence for {os.path.basename(amr_file)}...")
     seq_counter = 0
@@ -1784,7 +1866,7 @@ def neighborhood_sequence_extraction(
                 path_info_list,
                 seq_info,
             ) = extract_neighborhood_sequence(
-                gfa_file,
+                myGraph,
                 length,
                 amr_path_info,
                 path_node_threshold,
@@ -1813,7 +1895,7 @@ def neighborhood_sequence_extraction(
                 path_info_list,
                 seq_info,
             ) = extract_neighborhood_sequence(
-                gfa_file,
+                myGraph,
                 length,
                 amr_path_info,
                 path_node_threshold,
@@ -1836,7 +1918,7 @@ def neighborhood_sequence_extraction(
                 path_info_list,
                 seq_info,
             ) = extract_neighborhood_sequence(
-                gfa_file,
+                myGraph,
                 length,
                 amr_path_info,
                 path_node_threshold,
@@ -1860,7 +1942,7 @@ def neighborhood_sequence_extraction(
                 path_info_list,
                 seq_info,
             ) = extract_neighborhood_sequence(
-                gfa_file,
+                myGraph,
                 length,
                 amr_path_info,
                 path_node_threshold,
@@ -14,23 +14,34 @@ NOTE: all parameters can be set in params.py
 NOTE: if use_RGI = TRUE, make sure either RGI has been installed system-wide or
     you already are in the environment RGI installed in!
 """
-import copy
+import atexit
 import csv
+import hashlib
+import mmap
 import os
+import re
 import shutil
-import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from functools import partial
+from operator import attrgetter
 from multiprocessing.pool import Pool
 from pathlib import Path
 from typing import Dict, List, Any
 
+import numpy as np
+import pandas as pd
+
 from sarand.annotation_visualization import visualize_annotation
 from sarand.config import AMR_DIR_NAME, AMR_SEQ_DIR, AMR_ALIGN_DIR, AMR_OVERLAP_FILE, SEQ_DIR_NAME, SEQ_NAME_PREFIX, \
     ANNOTATION_DIR
+from sarand.exceptions import SarandPipelineError
 from sarand.external.graph_aligner import GraphAligner, GraphAlignerParams
-from sarand.extract_neighborhood import neighborhood_sequence_extraction
-from sarand.model.fasta_seq import FastaSeq
-from sarand.util.file import try_dump_to_disk
+from sarand.extract_neighborhood import neighborhood_sequence_extraction, preload_gfa, clear_gfa_cache
+from sarand.model.amr_record import AmrRecord
+from sarand.model.gene_info import GeneInfo
+from sarand.util.file import try_dump_to_disk, try_dump_jsonl_to_disk, remove_dir_in_background, \
+    join_dir_removals, ensure_dir
 from sarand.util.logger import LOG
 from sarand.utils import (
     retrieve_AMR,
@@ -38,6 +49,7 @@ from sarand.utils import (
     split_up_down_info,
     seqs_annotation_are_identical,
     similar_seq_annotation_already_exist,
+    seq_annotation_genes,
     amr_name_from_comment,
     extract_name_from_file_name,
     restricted_amr_name_from_modified_name,
@@ -48,6 +60,75 @@ from sarand.utils import (
 )
 
 
+# the AMR in an extracted sequence: from the first lower-case character up to
+# the next upper-case one
+_RE_AMR_SEQ = re.compile(r"[a-z][^A-Z]*")
+
+# the name of the sequence and path info files written by neighborhood_sequence_extraction:
+# <SEQ_NAME_PREFIX><amr_name>_<seq_length>_<date>_<time>.<ext>
+_RE_SEQ_PATH_FILE_NAME = re.compile(
+    re.escape(SEQ_NAME_PREFIX) + r"(.+)_(\d+)_\d{4}-\d{2}-\d{2}_\d{2}-\d{2}\.\w+$"
+)
+
+# the arguments of neighborhood_sequence_extraction shared by all AMRs, set in
+# each extraction worker by _init_extraction_worker
+_EXTRACTION_ARGS = None
+
+# the in-memory file system used for temporary files (if available)
+_SHM_DIR = "/dev/shm"
+
+# the columns of the path info files
+_PATH_INFO_COLUMNS = ["sequence", "node", "coverage", "start", "end"]
+
+# the process pool annotating neighborhood sequences, kept between AMRs
+_ANNOTATION_POOL = None
+_ANNOTATION_POOL_SIZE = 0
+
+# the columns of the annotation files following seq_name, seq_value and seq_length,
+# keyed by no_RGI
+_ANNOTATION_GETTERS = {
+    False: attrgetter(
+        "gene",
+        # "prokka_gene_name",
+        "product",
+        "length",
+        "start_pos",
+        "end_pos",
+        "RGI_prediction_type",
+        "coverage",
+        "family",
+        "target_amr",
+    ),
+    True: attrgetter(
+        "gene",
+        "product",
+        "length",
+        "start_pos",
+        "end_pos",
+        "coverage",
+        "target_amr",
+    ),
+}
+
+
+def annotation_info_row(gene_info, no_RGI, len_seq=None):
+    """
+    To generate the row of the annotation files for a gene
+    Parameters:
+        gene_info: annotation info
+        no_RGI: if True, RGI has not been used to annotate AMRs
+        len_seq: the value of the sequence length column (if None, it's calculated)
+    Return:
+        the tuple of column values
+    """
+    seq = gene_info.seq_value
+    if len_seq is None:
+        len_seq = len(seq)
+    return (gene_info.seq_name, seq, len_seq) + _ANNOTATION_GETTERS[bool(no_RGI)](
+        gene_info
+    )
+
+
 def write_info_in_annotation_file(
         annotation_writer, visual_annotation_writer, gene_info, no_RGI, found, len_seq=None
 ):
@@ -56,83 +137,15 @@ def write_info_in_annotation_file(
     Parameters:
         annotation_writer:	annotation file containing all annotations
         visual_annotation_writer: annotation file containing unique annotations
-        seq_description: a small description of the sequence used for naming
-        seq: the extracted dna sequence that has been annotated
         gene_info: annotation info
-        contig_name: the name of contig matching this extracted sequence (if there is any contig)
         no_RGI: if True, RGI has not been used to annotate AMRs
         found: if True, the annotation info has already found in other annotated sequences
+        len_seq: the value of the sequence length column (if None, it's calculated)
     """
-    seq = gene_info["seq_value"]
-    seq_description = gene_info["seq_name"]
-    if len_seq is None:
-        len_seq = len(seq)
-    if not no_RGI:
-        annotation_writer.writerow(
-            [
-                seq_description,
-                seq,
-                len_seq,
-                gene_info["gene"],
-                # gene_info["prokka_gene_name"],
-                gene_info["product"],
-                gene_info["length"],
-                gene_info["start_pos"],
-                gene_info["end_pos"],
-                gene_info["RGI_prediction_type"],
-                gene_info["coverage"],
-                gene_info["family"],
-                gene_info["target_amr"],
-            ]
-        )
-        if not found:
-            visual_annotation_writer.writerow(
-                [
-                    seq_description,
-                    seq,
-                    len_seq,
-                    gene_info["gene"],
-                    # gene_info["prokka_gene_name"],
-                    gene_info["product"],
-                    gene_info["length"],
-                    gene_info["start_pos"],
-                    gene_info["end_pos"],
-                    gene_info["RGI_prediction_type"],
-                    gene_info["coverage"],
-                    gene_info["family"],
-                    gene_info["target_amr"],
-                ]
-            )
-    else:
-        annotation_writer.writerow(
-            [
-                seq_description,
-                seq,
-                len_seq,
-                gene_info["gene"],
-                gene_info["product"],
-                gene_info["length"],
-                gene_info["start_pos"],
-                gene_info["end_pos"],
-                gene_info["coverage"],
-                gene_info["target_amr"],
-            ]
-        )
-        if not found:
-            visual_annotation_writer.writerow(
-                [
-                    seq_description,
-                    seq,
-                    len_seq,
-                    gene_info["gene"],
-                    gene_info["product"],
-                    gene_info["length"],
-                    gene_info["start_pos"],
-                    gene_info["end_pos"],
-                    gene_info["coverage"],
-                    gene_info["target_amr"],
-                ]
-            )
+    row = annotation_info_row(gene_info, no_RGI, len_seq)
+    annotation_writer.writerow(row)
+    if not found:
+        visual_annotation_writer.writerow(row)
 
 
 def seq_annotation_already_exist(seq_info_list, all_seq_info_lists, out_dir):
@@ -162,45 +175,84 @@ def read_path_info_file(path_info_file):
     Parameter:
         path_info_file: the csv file
     Return:
-        stored info in a list
-    """
-    seq_info_list = []
-    seq_info = []
-    with open(path_info_file, "r") as myfile:
-        myreader = csv.DictReader(myfile)
-        old_seq = ""
-        for row in myreader:
-            # @Somayeh: hacky fix for whatever is causing the path info files
-            # to contain the same data duplicated
-            # sequence,node,coverage,start,end
-            # 1,127,12.603822917195512,0,999
-            # 1,127,12.603822917195512,1000,1731
-            # 1,127,12.603822917195512,1732,2731
-            # sequence,node,coverage,start,end
-            # 1,127,12.603822917195512,0,999
-            # 1,127,12.603822917195512,1000,1731
-            # 1,127,12.603822917195512,1732,2731
-            # sequence,node,coverage,start,end
-            # 1,127,12.603822917195512,0,999
-            # 1,127,12.603822917195512,1000,1731
-            # 1,127,12.603822917195512,1732,2731
-            if row["coverage"] == "coverage":
-                continue
-            node_info = {
-                "node": row["node"],
-                "coverage": float(row["coverage"]),
-                "start": int(row["start"]),
-                "end": int(row["end"]),
-            }
-            cur_seq = row["sequence"]
-            if cur_seq != old_seq:
-                if seq_info:
-                    seq_info_list.append(seq_info)
-                seq_info = []
-                old_seq = cur_seq
-            seq_info.append(node_info)
-        seq_info_list.append(seq_info)
-    return seq_info_list
+        for each sequence, the start, end and coverage of its nodes as numpy
+        arrays (starts, ends, coverages)
+    """
+    try:
+        df = pd.read_csv(
+            path_info_file,
+            header=None,
+            names=_PATH_INFO_COLUMNS,
+            usecols=["sequence", "coverage", "start", "end"],
+            dtype=str,
+            engine="c",
+        )
+    except pd.errors.EmptyDataError:
+        df = None
+    # @Somayeh: hacky fix for whatever is causing the path info files
+    # to contain the same data duplicated
+    # sequence,node,coverage,start,end
+    # 1,127,12.603822917195512,0,999
+    # 1,127,12.603822917195512,1000,1731
+    # 1,127,12.603822917195512,1732,2731
+    # sequence,node,coverage,start,end
+    # 1,127,12.603822917195512,0,999
+    # 1,127,12.603822917195512,1000,1731
+    # 1,127,12.603822917195512,1732,2731
+    # neighborhood_sequence_extraction now truncates the file before writing,
+    # the header rows are skipped for files written by earlier versions
+    if df is not None:
+        df = df[df["coverage"] != "coverage"]
+    if df is None or df.empty:
+        return [_node_ranges_to_arrays([], [], [])]
+    sequences = df["sequence"].to_numpy()
+    starts = df["start"].to_numpy(dtype=np.int64)
+    ends = df["end"].to_numpy(dtype=np.int64)
+    coverages = df["coverage"].to_numpy(dtype=np.float64)
+    # the nodes of a sequence are in consecutive rows
+    breaks = np.flatnonzero(sequences[1:] != sequences[:-1]) + 1
+    return list(
+        zip(np.split(starts, breaks), np.split(ends, breaks), np.split(coverages, breaks))
+    )
+
+
+def _node_ranges_to_arrays(starts, ends, coverages):
+    """Convert the node ranges and coverages of a sequence to numpy arrays."""
+    return (
+        np.array(starts, dtype=np.int64),
+        np.array(ends, dtype=np.int64),
+        np.array(coverages, dtype=np.float64),
+    )
+
+
+def _gene_coverage_in_unordered_nodes(start, end, starts, ends, coverages):
+    """
+    To calculate the sum of coverages of the nodes representing a gene by walking
+    the nodes one by one; used when the nodes are not sorted and disjoint
+    Return:
+        True and the sum of coverages if a node containing the gene start was found;
+        otherwise, False and 0
+    """
+    for j in range(len(starts)):
+        if starts[j] <= start and ends[j] >= start:
+            # the annotated gene is represented by a single node
+            if ends[j] >= end:
+                return True, (end - start + 1) * coverages[j]
+            # calculate the length of node representing the gene
+            sum_coverage = (ends[j] - start + 1) * coverages[j]
+            n_index = j + 1
+            assert n_index < len(starts), "wrong index calculated for path_info!!"
+            while n_index < len(starts) and starts[n_index] <= end:
+                if ends[n_index] >= end:
+                    sum_coverage += (end - starts[n_index] + 1) * coverages[n_index]
+                    break
+                else:
+                    sum_coverage += (
+                        ends[n_index] - starts[n_index] + 1
+                    ) * coverages[n_index]
+                n_index += 1
+            return True, sum_coverage
+    return False, 0
 
 
 def find_gene_coverage(seq_info_list, path_info):
@@ -209,56 +261,49 @@ def find_gene_coverage(seq_info_list, path_info):
     of the nodes representing them
     Parameter:
         seq_info_list: the list of genes (and their info) annotated in a sequence
-        path_info:	the list of nodes (and their info) representing the sequence
+        path_info:	the start, end and coverage arrays of the nodes representing
+            the sequence (as returned by read_path_info_file)
     Return:
         the list of calculated gene-coverages
     """
+    starts, ends, coverages = path_info
+    # nodes are normally sorted and disjoint, so the nodes representing a gene
+    # can be found by binary search
+    ordered = bool(np.all(starts <= ends) and np.all(starts[1:] > ends[:-1]))
+    if not ordered:
+        starts, ends, coverages = starts.tolist(), ends.tolist(), coverages.tolist()
     coverage_list = []
     for seq_info in seq_info_list:
-        sum_coverage = 0
         # minus 1 because I guess in what prokka returns the sequence starts from position 1
-        start, end = seq_info["start_pos"] - 1, seq_info["end_pos"] - 1
+        start, end = seq_info.start_pos - 1, seq_info.end_pos - 1
         if start > end:
             start, end = end, start
-        found = False
-        for j, node_info in enumerate(path_info):
-            if node_info["start"] <= start and node_info["end"] >= start:
-                found = True
-                # the annotated gene is represented by a single node
-                if node_info["end"] >= end:
-                    sum_coverage = (end - start + 1) * node_info["coverage"]
-                else:
-                    # calculate the length of node representing the gene
-                    sum_coverage = (node_info["end"] - start + 1) * node_info[
-                        "coverage"
-                    ]
-                    n_index = j + 1
-                    assert n_index < len(
-                        path_info
-                    ), "wrong index calculated for path_info!!"
-                    while (
-                            n_index < len(path_info) and path_info[n_index]["start"] <= end
-                    ):
-                        if path_info[n_index]["end"] >= end:
-                            sum_coverage += (
-                                                    end - path_info[n_index]["start"] + 1
-                                            ) * path_info[n_index]["coverage"]
-                            break
-                        else:
-                            sum_coverage += (
-                                                    path_info[n_index]["end"]
-                                                    - path_info[n_index]["start"]
-                                                    + 1
-                                            ) * path_info[n_index]["coverage"]
-                        n_index += 1
-                coverage_list.append(sum_coverage / (end - start + 1))
-                break
+        if ordered:
+            # the first node ending at/after start and the last one starting at/before end
+            first = int(np.searchsorted(ends, start, side="left"))
+            found = first < len(ends) and starts[first] <= start
+            if found:
+                last = max(first, int(np.searchsorted(starts, end, side="right")) - 1)
+                assert first + 1 < len(ends) or ends[first] >= end, \
+                    "wrong index calculated for path_info!!"
+                lengths = (
+                        np.minimum(ends[first:last + 1], end)
+                        - np.maximum(starts[first:last + 1], start)
+                        + 1
+                )
+                # summed in order to give the same value as adding them one by one
+                sum_coverage = sum((lengths * coverages[first:last + 1]).tolist())
+        else:
+            found, sum_coverage = _gene_coverage_in_unordered_nodes(
+                start, end, starts, ends, coverages
+            )
         if not found:
             LOG.error("ERROR: no nodes were found for this gene!!!")
-            import pdb
-
-            pdb.set_trace()
-            sys.exit(1)
+            raise SarandPipelineError(
+                "No nodes were found for gene " + str(seq_info.gene)
+                + " at " + str(start) + "-" + str(end)
+            )
+        coverage_list.append(sum_coverage / (end - start + 1))
     return coverage_list
 
 
@@ -277,35 +322,40 @@ def find_target_amr_in_seqvalue_and_return_coverage(seq_info):
     error = True
     amr_coverage = 0
     # find the indeces of lower case string (amr sequence) in the extracted sequence
-    sequence = seq_info[0]["seq_value"]
+    sequence = seq_info[0].seq_value
     amr_start = -1
     amr_end = -1
-    index = 0
-    while index < len(sequence):
-        if sequence[index].islower() and amr_start == -1:
-            amr_start = index
-        elif sequence[index].isupper() and amr_start > -1:
-            amr_end = index - 1
-            break
-        index += 1
+    amr_match = _RE_AMR_SEQ.search(sequence)
+    if amr_match:
+        amr_start = amr_match.start()
+        # the end is only set if an upper-case character follows the AMR
+        if amr_match.end() < len(sequence):
+            amr_end = amr_match.end() - 1
     # find the gene has the most overlap with the found range
     # we look at all found genes that their overlap with the sequence is more than initial value of most_overlap and chose the one with max
     most_overlap = 50
     amr_index = -1
-    for i, gene_info in enumerate(seq_info):
-        start, end = min(gene_info["start_pos"], gene_info["end_pos"]), max(
-            gene_info["start_pos"], gene_info["end_pos"]
+    positions = np.array(
+        [(gene_info.start_pos, gene_info.end_pos) for gene_info in seq_info],
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    starts, ends = positions.min(axis=1), positions.max(axis=1)
+    candidates = np.flatnonzero(
+        (ends >= amr_start) & (starts <= amr_end) & (ends > starts)
+    )
+    if len(candidates):
+        starts, ends = starts[candidates], ends[candidates]
+        # added by 1 because in string indecesstarts from 0
+        diff = np.maximum(amr_start + 1 - starts, 0) + np.maximum(
+            ends - (amr_end + 1), 0
         )
-        if end < amr_start or start > amr_end:
-            continue
-        else:
-            # added by 1 because in string indecesstarts from 0
-            diff = max((amr_start + 1 - start), 0) + max((end - (amr_end + 1)), 0)
-            if ((1 - (float(diff) / (end - start))) * 100) > most_overlap:
-                most_overlap = (1 - (float(diff) / (end - start))) * 100
-                amr_coverage = gene_info["coverage"]
-                amr_index = i
-                error = False
+        overlap = (1 - diff / (ends - starts)) * 100
+        # argmax returns the first gene with the most overlap
+        best = int(overlap.argmax())
+        if overlap[best] > most_overlap:
+            amr_index = int(candidates[best])
+            amr_coverage = seq_info[amr_index].coverage
+            error = False
     return amr_coverage, amr_index, error
 
 
@@ -324,18 +374,20 @@ def check_coverage_consistency_remove_rest_seq(
         annotate_dir:	the directory in which annotation info are stored
     Return:
     """
-    seq_info_list = copy.deepcopy(seq_info_list_input)
+    # the genes are not modified below and the remained genes of each sequence are
+    # put in a new list, so the input isn't changed
+    seq_info_list = seq_info_list_input
     # extract amr info
     amr_coverages = []
     amr_indeces = []
     for seq_info in seq_info_list:
         found_amr = False
         for gene_counter, gene_info in enumerate(seq_info):
-            if gene_info["coverage"] is None:
+            if gene_info.coverage is None:
                 LOG.info("Coverage information are not available for " + amr_name)
                 return "", 0
-            coverage = round(gene_info["coverage"], 2)
-            if gene_info["target_amr"] == "yes":
+            coverage = round(gene_info.coverage, 2)
+            if gene_info.target_amr == "yes":
                 amr_coverages.append(coverage)
                 amr_indeces.append(gene_counter)
                 found_amr = True
@@ -353,10 +405,10 @@ def check_coverage_consistency_remove_rest_seq(
                     + " regarding "
                     + amr_name
                 )
-                import pdb
-
-                pdb.set_trace()
-                sys.exit(1)
+                raise SarandPipelineError(
+                    "No target amr was found for " + str(seq_info)
+                    + " regarding " + amr_name
+                )
             else:
                 amr_coverages.append(amr_coverage)
                 amr_indeces.append(amr_index)
@@ -364,41 +416,66 @@ def check_coverage_consistency_remove_rest_seq(
         LOG.error(
             "Inconsistency between the number of sequences and found amr-coverages!"
         )
-        import pdb
-
-        pdb.set_trace()
+        raise SarandPipelineError(
+            "Inconsistency between the number of sequences and found "
+            "amr-coverages for " + amr_name
+        )
     # check coverage consistency by comparing its coverage with AMR coverage
     # and remove genes with inconsistent coverage and whatever comes before them if upstream OR after them if downstream
     remained_seqs = []
+    # remained sequences grouped by their gene names, as only those with the same
+    # gene names need to be compared
+    remained_seqs_by_genes = dict()
     for i, seq_info in enumerate(seq_info_list):
         # find the genes need to be removed
-        to_be_removed_genes = []
+        to_be_removed_genes = set()
         for j, gene_info in enumerate(seq_info):
-            if abs(gene_info["coverage"] - amr_coverages[i]) > coverage_thr:
+            if abs(gene_info.coverage - amr_coverages[i]) > coverage_thr:
                 if j < amr_indeces[i]:
-                    for k in range(j + 1):
-                        if k not in to_be_removed_genes:
-                            to_be_removed_genes.append(k)
+                    to_be_removed_genes.update(range(j + 1))
                 elif j > amr_indeces[i]:
-                    for k in range(j, len(seq_info)):
-                        if k not in to_be_removed_genes:
-                            to_be_removed_genes.append(k)
+                    to_be_removed_genes.update(range(j, len(seq_info)))
                     break
-        for j in reversed(range(len(seq_info))):
-            if j in to_be_removed_genes:
-                del seq_info[j]
+        if to_be_removed_genes:
+            seq_info = [
+                gene_info
+                for j, gene_info in enumerate(seq_info)
+                if j not in to_be_removed_genes
+            ]
         # check if the remained sequence already exists in the seq_info_list
-        if seq_info and not similar_seq_annotation_already_exist(
-                seq_info, remained_seqs, annotate_dir
+        if not seq_info:
+            continue
+        same_genes_seqs = remained_seqs_by_genes.setdefault(
+            seq_annotation_genes(seq_info), []
+        )
+        if not similar_seq_annotation_already_exist(
+                seq_info, same_genes_seqs, annotate_dir
         ):
             remained_seqs.append(seq_info)
+            same_genes_seqs.append(seq_info)
 
     # Initialize coverage file
     coverage_annotation = os.path.join(
         annotate_dir,
         "coverage_annotation_" + str(coverage_thr) + "_" + amr_name + ".csv",
     )
-    with open(coverage_annotation, "w") as fd:
+    # extracted sequences with consistent coverage
+    rows = [
+        [
+            gene_info.seq_name,
+            gene_info.seq_value,
+            len(gene_info.seq_value),
+            gene_info.gene,
+            gene_info.coverage,
+            gene_info.length,
+            gene_info.start_pos,
+            gene_info.end_pos,
+            gene_info.target_amr,
+        ]
+        for seq_info in remained_seqs
+        for gene_info in seq_info
+    ]
+    with open(coverage_annotation, "w", buffering=1 << 20) as fd:
         writer = csv.writer(fd)
         writer.writerow(
             [
@@ -413,33 +490,19 @@ def check_coverage_consistency_remove_rest_seq(
                 "target_amr",
             ]
         )
-        # write extracted sequences with consistent coverage
-        for seq_info in remained_seqs:
-            for gene_info in seq_info:
-                writer.writerow(
-                    [
-                        gene_info["seq_name"],
-                        gene_info["seq_value"],
-                        len(gene_info["seq_value"]),
-                        gene_info["gene"],
-                        gene_info["coverage"],
-                        gene_info["length"],
-                        gene_info["start_pos"],
-                        gene_info["end_pos"],
-                        gene_info["target_amr"],
-                    ]
-                )
+        writer.writerows(rows)
 
     return coverage_annotation, len(remained_seqs)
 
 
-def extract_seq_annotation(annotate_dir, no_RGI, RGI_include_loose, seq_pair):
+def extract_seq_annotation(annotate_dir, no_RGI, RGI_include_loose, threads, seq_pair):
     """
     The function used in parallel anntation to call the function for annotating a sequence
     Parameters:
         annotate_dir: the directory to store annotation output
         no_RGI: if True we want to call RGI for annotating AMRs
         RGI_include_loose: if True loose mode is used
+        threads: the number of threads used by Bakta for this sequence
         seq_pair: the index and the value of a sequence to be annotated
     Return:
         the list of annotated genes
@@ -452,10 +515,44 @@ def extract_seq_annotation(annotate_dir, no_RGI, RGI_include_loose, seq_pair):
         annotate_dir,
         no_RGI,
         RGI_include_loose,
+        threads=threads,
     )
     return seq_info_list
 
 
+def _get_annotation_pool(core_num):
+    """
+    To return the process pool used to annotate the sequences of all AMRs; it's
+    created on first use (and again if a different number of cores is requested)
+    and shut down at exit
+    """
+    global _ANNOTATION_POOL, _ANNOTATION_POOL_SIZE
+    if _ANNOTATION_POOL is not None and _ANNOTATION_POOL_SIZE != core_num:
+        _shutdown_annotation_pool()
+    if _ANNOTATION_POOL is None:
+        _ANNOTATION_POOL = ProcessPoolExecutor(max_workers=core_num)
+        _ANNOTATION_POOL_SIZE = core_num
+    return _ANNOTATION_POOL
+
+
+def _shutdown_annotation_pool():
+    """To shut down the annotation process pool (if it was created)"""
+    global _ANNOTATION_POOL
+    if _ANNOTATION_POOL is not None:
+        _ANNOTATION_POOL.shutdown()
+        _ANNOTATION_POOL = None
+
+
+atexit.register(_shutdown_annotation_pool)
+
+
+def _annotation_cache_key(seq, no_RGI, RGI_include_loose):
+    """To return the key of the annotation of a sequence in an annotation cache"""
+    return hashlib.blake2b(seq.encode(), digest_size=16).digest() + bytes(
+        [bool(no_RGI), bool(RGI_include_loose)]
+    )
+
+
 def extract_graph_seqs_annotation(
         amr_name,
         path_info_file,
@@ -468,6 +565,7 @@ def extract_graph_seqs_annotation(
         trimmed_annotation_writer,
         gene_file,
         error_file,
+        annotation_cache=None,
 ):
     """
     To annotate neighborhood sequences of AMR extracted from the graph in parallel
@@ -483,46 +581,94 @@ def extract_graph_seqs_annotation(
         trimmed_annotation_writer: the file to store unique annotation results
         gene_file: the file to store gene nams in annotation
         error_file: the file to store errors
+        annotation_cache: the annotations of the sequences already annotated (keyed
+            by _annotation_cache_key), updated with the sequences annotated here;
+            if None, only the duplicate sequences of this AMR are annotated once
     Return:
         the list of annotated genes and their details
     """
-    error_writer = open(error_file, "a")
     # Read path_info from the file
     path_info_list = []
     if path_info_file != -1:
         path_info_list = read_path_info_file(path_info_file)
     # find the list of all extracted sequences
     LOG.debug("Reading " + neighborhood_seq_file + " for " + amr_name)
-    sequence_list = []
-    counter = 1
-    with open(neighborhood_seq_file, "r") as read_obj:
-        for line in read_obj:
-            if (
-                    line.startswith(">")
-                    or line.startswith("Path")
-                    or line.startswith("The")
-            ):
-                continue
-            sequence_list.append((counter, line))
-            counter += 1
+    with open(neighborhood_seq_file, "rb") as read_obj:
+        # an empty file can't be memory-mapped
+        if os.fstat(read_obj.fileno()).st_size == 0:
+            lines = []
+        else:
+            with mmap.mmap(read_obj.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                lines = mm[:].splitlines()
+    sequence_list = list(
+        enumerate(
+            (
+                line.decode()
+                for line in lines
+                if not line.startswith((b">", b"Path", b"The"))
+            ),
+            start=1,
+        )
+    )
+
+    # only annotate the sequences that haven't been annotated before, the Bakta
+    # and RGI output directories (in annotate_dir) are only created for those
+    if annotation_cache is None:
+        annotation_cache = dict()
+    cache_keys = [
+        _annotation_cache_key(seq, no_RGI, RGI_include_loose)
+        for _, seq in sequence_list
+    ]
+    to_annotate = dict()
+    for key, seq_pair in zip(cache_keys, sequence_list):
+        if key not in annotation_cache and key not in to_annotate:
+            to_annotate[key] = seq_pair
+    LOG.debug(
+        str(len(sequence_list) - len(to_annotate))
+        + " sequences of " + amr_name + " were already annotated"
+    )
+
+    # Bakta is multithreaded, split the cores between the sequences annotated in
+    # parallel rather than letting each Bakta process use every CPU
+    bakta_threads = max(1, core_num // max(1, min(core_num, len(to_annotate))))
 
     # Parallel annotation
     """
     AM: Do not initialise a multiprocessing pool if only one thread is required.
     """
-    if core_num == 1:
-        seq_info_list = list()
-        for x in sequence_list:
-            seq_info_list.append(extract_seq_annotation(annotate_dir, no_RGI, RGI_include_loose, x))
+    if core_num == 1 or len(to_annotate) <= 1:
+        new_seq_info_list = list()
+        for x in to_annotate.values():
+            new_seq_info_list.append(extract_seq_annotation(
+                annotate_dir, no_RGI, RGI_include_loose, bakta_threads, x
+            ))
     else:
         p_annotation = partial(
-            extract_seq_annotation, annotate_dir, no_RGI, RGI_include_loose
+            extract_seq_annotation, annotate_dir, no_RGI, RGI_include_loose, bakta_threads
         )
-        with Pool(core_num) as p:
-            seq_info_list = p.map(p_annotation, sequence_list)
+        chunksize = max(1, len(to_annotate) // (core_num * 4))
+        new_seq_info_list = list(
+            _get_annotation_pool(core_num).map(
+                p_annotation, to_annotate.values(), chunksize=chunksize
+            )
+        )
+    annotation_cache.update(zip(to_annotate, new_seq_info_list))
+    # the annotations are updated below, so each sequence gets its own copy
+    seq_info_list = [
+        [gene_info.copy() for gene_info in annotation_cache[key]]
+        for key in cache_keys
+    ]
 
     # Further processing of result of parallel annotation
     all_seq_info_list = []
+    # the annotations found so far grouped by their gene names, as only those
+    # with the same gene names can be identical
+    all_seq_info_lists_by_genes = dict()
+    # rows are buffered and written once per AMR
+    annotation_rows = []
+    trimmed_annotation_rows = []
+    gene_lines = []
+    error_lines = []
     # if amr_name=='GES-4' or amr_name=='GES-21':
     # 	import pdb; pdb.set_trace()
     for i, seq_pair in enumerate(sequence_list):
@@ -530,12 +676,16 @@ def extract_graph_seqs_annotation(
         seq_description = "extracted" + str(counter)
         seq_info = seq_info_list[i]
         # extract amr from seq_info
-        amr_found, amr_info, up_info, down_info, seq_info = split_up_down_info(
-            line[:-1], seq_info
-        )
+        try:
+            amr_found, amr_info, up_info, down_info, seq_info = split_up_down_info(
+                line, seq_info
+            )
+        except SarandPipelineError as e:
+            error_lines.append(amr_name + " " + str(e) + "\n")
+            continue
         if not amr_found:
             LOG.error("ERROR: no target amr was found in the extracted sequence")
-            error_writer.write(
+            error_lines.append(
                 amr_name
                 + " annotation not found! "
                 + " seq_info: "
@@ -547,32 +697,60 @@ def extract_graph_seqs_annotation(
         # calculate coverage for the genes available in the annotation
         coverage_list = []
         if path_info_list:
-            coverage_list = find_gene_coverage(seq_info, path_info_list[counter - 1])
+            try:
+                coverage_list = find_gene_coverage(
+                    seq_info, path_info_list[counter - 1]
+                )
+            except SarandPipelineError as e:
+                error_lines.append(amr_name + " " + str(e) + "\n")
+                continue
         # Check if this annotation has already been found
-        found = seq_annotation_already_exist(seq_info, all_seq_info_list, annotate_dir)
+        same_genes_seq_info_list = all_seq_info_lists_by_genes.setdefault(
+            seq_annotation_genes(seq_info), []
+        )
+        found = seq_annotation_already_exist(
+            seq_info, same_genes_seq_info_list, annotate_dir
+        )
         # If it's a novel sequence correct annotation (if applicable) for cases that RGI doesn't have a hit but Prokka has
         if not found:
             all_seq_info_list.append(seq_info)
+            same_genes_seq_info_list.append(seq_info)
         myLine1 = seq_description + ":\t"
         # write annotation onfo into the files
         for j, gene_info in enumerate(seq_info):
             coverage = coverage_list[j] if coverage_list else -1
-            gene_info["coverage"] = coverage
-            gene_info["seq_name"] = seq_description
-            write_info_in_annotation_file(
-                annotation_writer, trimmed_annotation_writer, gene_info, no_RGI, found
-            )
-            if gene_info["gene"] == "":
+            gene_info.coverage = coverage
+            gene_info.seq_name = seq_description
+            row = annotation_info_row(gene_info, no_RGI)
+            annotation_rows.append(row)
+            if not found:
+                trimmed_annotation_rows.append(row)
+            if gene_info.gene == "":
                 myLine1 += "UNKNOWN---"
             else:
-                myLine1 += gene_info["gene"] + "---"
-        gene_file.write(myLine1[:-3] + "\n")
+                myLine1 += gene_info.gene + "---"
+        gene_lines.append(myLine1[:-3] + "\n")
+    annotation_writer.writerows(annotation_rows)
+    trimmed_annotation_writer.writerows(trimmed_annotation_rows)
+    gene_file.writelines(gene_lines)
     if not all_seq_info_list:
-        error_writer.write(amr_name + " no annotation was found in the graph.\n")
-    error_writer.close()
+        error_lines.append(amr_name + " no annotation was found in the graph.\n")
+    with open(error_file, "a", buffering=1 << 16) as error_writer:
+        error_writer.writelines(error_lines)
     return all_seq_info_list
 
 
+def _base_annotate_dir(output_dir, seq_length):
+    """
+    To return the directory containing the annotation directories of all AMRs
+    Parameters:
+        output_dir:	the path for the output directory
+        seq_length:	the length of neighborhood sequence extracted from each side of
+            the AMR sequence
+    """
+    return Path(output_dir) / ANNOTATION_DIR / f"{ANNOTATION_DIR}_{seq_length}"
+
+
 def neighborhood_annotation(
         amr_name,
         neighborhood_seq_file,
@@ -583,6 +761,8 @@ def neighborhood_annotation(
         RGI_include_loose=False,
         output_name="",
         core_num=4,
+        base_annotate_dir=None,
+        annotation_cache=None,
 ):
     """
     To annotate reference genomes (a piece extracted around the AMR gene) as well as
@@ -598,54 +778,56 @@ def neighborhood_annotation(
         no_RGI:	RGI annotations not incorporated for AMR annotation
         RGI_include_loose: Whether to include loose annotaions in RGI
         output_name:the name used to distinguish different output files usually based on the name of AMR
+        core_num: the number of core for parallel processing
+        base_annotate_dir: the directory containing the annotation directories of
+            all AMRs (if None, it's found based on output_dir and seq_length)
+        annotation_cache: the annotations of the sequences already annotated
+            (see extract_graph_seqs_annotation)
     Return:
         the address of files stroing annotation information (annotation_detail_name,
             trimmed_annotation_info, gene_file_name, visual_annotation)
     """
     LOG.info("Annotating " + amr_name)
     # initializing required files and directories
-    annotate_dir = os.path.join(
-        output_dir,
-        ANNOTATION_DIR,
-        ANNOTATION_DIR + "_" + str(seq_length),
-        "annotation" + output_name + "_" + str(seq_length),
-    )
-    if os.path.exists(annotate_dir):
+    if base_annotate_dir is None:
+        base_annotate_dir = _base_annotate_dir(output_dir, seq_length)
+    annotate_dir = base_annotate_dir / f"annotation{output_name}_{seq_length}"
+    if annotate_dir.exists():
         try:
-            shutil.rmtree(annotate_dir)
+            remove_dir_in_background(annotate_dir)
         except OSError as e:
             LOG.error("Error: %s - %s." % (e.filename, e.strerror))
     os.makedirs(annotate_dir)
-    error_file = os.path.join(
-        output_dir,
-        ANNOTATION_DIR,
-        ANNOTATION_DIR + "_" + str(seq_length),
-        "not_found_annotation_amrs_in_graph.txt",
-    )
+    error_file = base_annotate_dir / "not_found_annotation_amrs_in_graph.txt"
     annotation_detail_name = os.path.join(
         annotate_dir, "annotation_detail" + output_name + ".csv"
     )
     trimmed_annotation_info_name = os.path.join(
         annotate_dir, "trimmed_annotation_info" + output_name + ".csv"
     )
-    annotation_detail = open(annotation_detail_name, mode="w", newline="")
-    trimmed_annotation_info = open(trimmed_annotation_info_name, mode="w", newline="")
+    annotation_detail = open(
+        annotation_detail_name, mode="w", newline="", buffering=1 << 20
+    )
+    trimmed_annotation_info = open(
+        trimmed_annotation_info_name, mode="w", newline="", buffering=1 << 20
+    )
     annotation_writer = csv.writer(annotation_detail)
     trimmed_annotation_writer = csv.writer(trimmed_annotation_info)
-    gene_info = {
-        "seq_value": "seq_value",
-        "gene": "gene",
-        # "prokka_gene_name": "prokka_gene_name",
-        "product": "product",
-        "length": "length",
-        "start_pos": "start_pos",
-        "end_pos": "end_pos",
-        "RGI_prediction_type": "RGI_prediction_type",
-        "coverage": "coverage",
-        "family": "family",
-        "seq_name": "seq_name",
-        "target_amr": "target_amr",
-    }
+    gene_info = GeneInfo(
+        locus_tag="locus_tag",
+        seq_value="seq_value",
+        gene="gene",
+        # prokka_gene_name="prokka_gene_name",
+        product="product",
+        length="length",
+        start_pos="start_pos",
+        end_pos="end_pos",
+        RGI_prediction_type="RGI_prediction_type",
+        coverage="coverage",
+        family="family",
+        seq_name="seq_name",
+        target_amr="target_amr",
+    )
     write_info_in_annotation_file(
         annotation_writer,
         trimmed_annotation_writer,
@@ -672,6 +854,7 @@ def neighborhood_annotation(
         trimmed_annotation_writer,
         gene_file,
         error_file,
+        annotation_cache,
     )
     LOG.debug(
         "The comparison of neighborhood sequences are available in "
@@ -686,7 +869,27 @@ def neighborhood_annotation(
     return all_seq_info_list, trimmed_annotation_info_name
 
 
-def amr_path_overlap(found_amr_paths, new_paths, new_amr_len, overlap_percent=95):
+def _path_nodes_key(path):
+    """To return the nodes and orientations of an AMR path as a hashable key"""
+    return tuple(path["nodes"]), tuple(path["orientations"])
+
+
+def index_amr_paths(paths_by_nodes, i, paths):
+    """
+    To add the paths found for an AMR to the index used in amr_path_overlap
+    Parameters:
+        paths_by_nodes: the index, mapping the nodes and orientations of a path to
+            the list of (index of AMR, path) having them
+        i: the index of the AMR in found_amr_paths
+        paths: the paths found for the AMR
+    """
+    for path in paths:
+        paths_by_nodes.setdefault(_path_nodes_key(path), []).append((i, path))
+
+
+def amr_path_overlap(
+        found_amr_paths, new_paths, new_amr_len, overlap_percent=95, paths_by_nodes=None
+):
     """
     To check if all paths found for the new AMR seq overlap significantly (greater/equal
      than/to overlap percent) with the already found paths for other AMRs
@@ -694,31 +897,30 @@ def amr_path_overlap(found_amr_paths, new_paths, new_amr_len, overlap_percent=95
          found_amr_paths:  	the paths already found for AMR genes
         new_paths: 			the paths found for the new AMR gene
         overlap_percent:	the threshold for overlap
+        paths_by_nodes: the index of found_amr_paths built by index_amr_paths
+            (if None, it's built here)
     Return:
         False only if every paths in new_paths have overlap with at least one path in found_amr_paths
         True if we can find at least one path that is unique and not available in found_amr_paths
         Also, it returns the list of indeces from found_amr_paths that had overlap with a path in new_paths
     """
+    # for now we just check overlaps when they are in the same node(s), so index
+    # the found paths by their nodes and orientations (keeping their order)
+    if paths_by_nodes is None:
+        paths_by_nodes = dict()
+        for i, paths in enumerate(found_amr_paths):
+            index_amr_paths(paths_by_nodes, i, paths)
+
     id_list = []
     for new_path in new_paths:
-        found = False
-        for i, paths in enumerate(found_amr_paths):
-            for path in paths:
-                if (
-                        path["nodes"] == new_path["nodes"]
-                        and path["orientations"] == new_path["orientations"]
-                ):
-                    # for now we just check overlaps when they are in the same node(s)
-                    diff_length = max(
-                        path["start_pos"] - new_path["start_pos"], 0
-                    ) + max(new_path["end_pos"] - path["end_pos"], 0)
-                    percent = (1 - (float(diff_length) / (new_amr_len))) * 100
-                    if percent >= overlap_percent:
-                        found = True
-                        if i not in id_list:
-                            id_list.append(i)
-                        break
-            if found:
+        for i, path in paths_by_nodes.get(_path_nodes_key(new_path), ()):
+            diff_length = max(
+                path["start_pos"] - new_path["start_pos"], 0
+            ) + max(new_path["end_pos"] - path["end_pos"], 0)
+            percent = (1 - (float(diff_length) / (new_amr_len))) * 100
+            if percent >= overlap_percent:
+                if i not in id_list:
+                    id_list.append(i)
                 break
     if len(id_list) == len(new_paths):
         return True, id_list
@@ -794,43 +996,49 @@ def find_all_amr_in_graph(
         debug: True if additional debug files should be created, False otherwise.
     """
     align_dir = os.path.join(output_dir, AMR_DIR_NAME, AMR_ALIGN_DIR)
-    os.makedirs(align_dir, exist_ok=True)
+    ensure_dir(align_dir)
 
     """
     AM: This replaces the original implementation of process_amr_group_and_find
     as it's more efficient to run GraphAligner using GraphAligner with multiple 
     threads instead of multiprocessing workers.
     """
-    d_amr_to_path_list = are_there_amrs_in_graph(
-        gfa_file=gfa_file,
-        output_dir=Path(align_dir),
-        threshold=amr_threshold,
-        amr_path=amr_sequences_file,
-        ga_extra_args=ga_extra_args,
-        keep_files=keep_files,
-        threads=core_num,
-        debug=debug
-    )
+    # The AMR sequences are read while GraphAligner aligns the same file
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        amr_records_future = executor.submit(extract_amr_sequences, amr_sequences_file)
+        d_amr_to_path_list = are_there_amrs_in_graph(
+            gfa_file=gfa_file,
+            output_dir=Path(align_dir),
+            threshold=amr_threshold,
+            amr_path=amr_sequences_file,
+            ga_extra_args=ga_extra_args,
+            keep_files=keep_files,
+            threads=core_num,
+            debug=debug
+        )
+        amr_records = amr_records_future.result()
     if debug:
-        try_dump_to_disk(d_amr_to_path_list, Path(align_dir) / 'debug_d_amr_to_path_list.json')
+        try_dump_jsonl_to_disk(
+            ({'amr_name': k, 'paths': v} for k, v in d_amr_to_path_list.items()),
+            Path(align_dir) / 'debug_d_amr_to_path_list.jsonl'
+        )
 
     """
     AM: The original implementation has been moved into the following function.
     This is because the output from GraphAligner is now from a single execution,
     and no longer needs to be concatenated from multiple executions.
     """
-    d_amr_to_seq = extract_amr_sequences(amr_sequences_file)
     unique_amr_seqs, unique_amr_infos, unique_amr_paths = get_unique_amr_info(
         d_amr_to_path_list,
-        d_amr_to_seq
+        amr_records
     )
     if debug:
-        try_dump_to_disk(
-            [
+        try_dump_jsonl_to_disk(
+            (
                 {'unique_amr_seqs': s, 'unique_amr_infos': i, 'unique_amr_paths': p}
                 for s, i, p in zip(unique_amr_seqs, unique_amr_infos, unique_amr_paths)
-            ],
-            Path(align_dir) / 'debug_get_unique_amr_info.json'
+            ),
+            Path(align_dir) / 'debug_get_unique_amr_info.jsonl'
         )
 
     # write information (the sequence of found AMRs that don't have overlaped paths with others
@@ -844,64 +1052,76 @@ def find_all_amr_in_graph(
     return unique_amr_files, unique_amr_paths
 
 
-def find_corrsponding_seq_path_file(
-        amr_name, sequences_file_names, path_info_file_names, seq_length
-):
+def index_seq_path_files(file_names):
     """
-    To return the name of a sequence file (from sequences_file_names)
-    and the name of a path file (from path_info_file_names)
-    dedicated to sequences extracted with a given length (seq_length)
-    from a given amr sequence (amr_name)
+    To index the sequence files (or path info files) written by
+    neighborhood_sequence_extraction by the AMR name and the sequence length
+    they were extracted for
+    Parameters:
+        file_names: the list of sequence (or path info) files
+    Return:
+        a dictionary mapping (amr_name, seq_length) to the file name, seq_length
+        is a string
     """
-    seq_file = -1
-    for file_name in sequences_file_names:
-        if SEQ_NAME_PREFIX + amr_name + "_" + str(seq_length) in file_name:
-            seq_file = file_name
-    path_file = -1
-    for file_name in path_info_file_names:
-        if SEQ_NAME_PREFIX + amr_name + "_" + str(seq_length) in file_name:
-            path_file = file_name
-    return seq_file, path_file
+    index = dict()
+    for file_name in file_names:
+        base_name = os.path.basename(file_name)
+        if not base_name.startswith(SEQ_NAME_PREFIX):
+            continue
+        match = _RE_SEQ_PATH_FILE_NAME.match(base_name)
+        if match:
+            index[match.groups()] = file_name
+    return index
+
+
+def read_amr_file_infos(amr_files):
+    """
+    To read the name of the AMR in each AMR file
+    Parameters:
+        amr_files: the list of files containing AMRs
+    Return:
+        the list of (amr_file, restricted_amr_name, amr_name) for each file
+    """
+    return [
+        (amr_file, extract_name_from_file_name(amr_file), retrieve_AMR(amr_file)[1])
+        for amr_file in amr_files
+    ]
 
 
 def seq_annotation_trim_main(
-        params, amr_files, all_seq_info_lists, annotation_files, visualize=False
+        params, amr_file_infos, all_seq_info_lists, annotation_files, visualize=False
 ):
     """
     The core function to filter and remove genes that their coverage difference
     from AMR coverage is above a threshold
     Prameters:
         params: the list of parameters imported from params.py
-        amr_files: the list of files containing AMRs
+        amr_file_infos: for each file containing an AMR, the file, the restricted
+            name and the name of the AMR (as returned by read_amr_file_infos)
         all_seq_info_lists: the list of annotations of neighborhood sequences extracted from the graph
         annotation_files: the files containing annotation info
         visualize: if True, visualize
     """
     coverage_annotation_list = []
-    for i, amr_file in enumerate(amr_files):
-        restricted_amr_name = extract_name_from_file_name(amr_file)
+    check_coverage = params.coverage_difference > 0
+    # nothing to filter or visualize
+    if not check_coverage and not visualize:
+        return coverage_annotation_list
+    base_annotate_dir = _base_annotate_dir(params.output_dir, params.neighbourhood_length)
+    for i, (_, restricted_amr_name, _) in enumerate(amr_file_infos):
         # remove some extracted sequences based on coverage consistency
-        annotate_dir = os.path.join(
-            params.output_dir,
-            ANNOTATION_DIR,
-            ANNOTATION_DIR + "_" + str(params.neighbourhood_length),
-            "annotation_"
-            + restricted_amr_name
-            + "_"
-            + str(params.neighbourhood_length),
+        annotate_dir = base_annotate_dir / (
+            f"annotation_{restricted_amr_name}_{params.neighbourhood_length}"
         )
         coverage_annotation = ""
-        remained_seqs = []
-        if params.coverage_difference > 0:
-            (
-                coverage_annotation,
-                remained_seqs,
-            ) = check_coverage_consistency_remove_rest_seq(
+        if check_coverage:
+            coverage_annotation, _ = check_coverage_consistency_remove_rest_seq(
                 all_seq_info_lists[i],
                 params.coverage_difference,
                 restricted_amr_name,
                 annotate_dir,
             )
+            coverage_annotation_list.append(coverage_annotation)
         if visualize:
             # create an image presenting the annotations for all sequences
             if coverage_annotation != "":
@@ -917,19 +1137,72 @@ def seq_annotation_trim_main(
                 + ".png",
             )
             visualize_annotation(visual_annotation_csv, output=visual_annotation)
-        if params.coverage_difference > 0:
-            coverage_annotation_list.append(coverage_annotation)
     return coverage_annotation_list
 
 
-def seq_annotation_main(params, seq_files, path_info_files, amr_files, debug: bool):
+def annotate_amr_neighborhood(
+        seq_length,
+        output_dir,
+        no_RGI,
+        RGI_include_loose,
+        core_num,
+        base_annotate_dir,
+        amr_info,
+        annotation_cache=None,
+):
+    """
+    The function used in parallel annotation of AMRs to call neighborhood_annotation
+    for an AMR
+    Parameters:
+        seq_length: the length of neighborhood sequence extracted from each side of
+            the AMR sequence
+        output_dir: the path for the output directory
+        no_RGI: RGI annotations not incorporated for AMR annotation
+        RGI_include_loose: Whether to include loose annotaions in RGI
+        core_num: the number of core for parallel processing of the sequences
+        base_annotate_dir: the directory containing the annotation directories of all AMRs
+        amr_info: the name of AMR, its sequence file, its path info file and its
+            restricted name
+        annotation_cache: the annotations of the sequences already annotated
+            (see extract_graph_seqs_annotation)
+    Return:
+        the list of annotated genes and the annotation file of the AMR
+    """
+    amr_name, neighborhood_file, nodes_info_file, restricted_amr_name = amr_info
+    return neighborhood_annotation(
+        amr_name,
+        neighborhood_file,
+        nodes_info_file,
+        seq_length,
+        output_dir,
+        no_RGI,
+        RGI_include_loose,
+        "_" + restricted_amr_name,
+        core_num,
+        base_annotate_dir,
+        annotation_cache,
+    )
+
+
+def _annotate_amr_neighborhood_in_worker(*args):
+    """
+    To call annotate_amr_neighborhood in a pool worker; atexit handlers don't run
+    in the workers, so the directories removed in the background are waited for here
+    """
+    result = annotate_amr_neighborhood(*args)
+    join_dir_removals()
+    return result
+
+
+def seq_annotation_main(params, seq_files, path_info_files, amr_file_infos, debug: bool):
     """
     The core function for annotation of neighborhood sequences of all AMRs
     Parameters:
         params: the list of parameters extracted from params.py
         seq_files: the list of neighborhood sequence files
         path_info_files: the list of files containing node info for all sequences
-        amr_files: the list of files containing AMRs
+        amr_file_infos: for each file containing an AMR, the file, the restricted
+            name and the name of the AMR (as returned by read_amr_file_infos)
         debug: True if additional files should be created, False otherwise.
     Return:
 
@@ -939,27 +1212,24 @@ def seq_annotation_main(params, seq_files, path_info_files, amr_files, debug: bo
         neighborhood_files = seq_files
     else:
         LOG.error("No file containing the extracted neighborhood sequences is available!")
-        import pdb
-        pdb.set_trace()
+        raise SarandPipelineError("No file containing the extracted neighborhood sequences is available!")
 
     if path_info_files:
         nodes_info_files = path_info_files
     else:
         LOG.error("No file containing path info for neighborhood sequences is available!")
-        import pdb
-        pdb.set_trace()
-
-    all_seq_info_lists = []
-    annotation_files = []
-    for amr_file in amr_files:
-        restricted_amr_name = extract_name_from_file_name(amr_file)
-        _, amr_name = retrieve_AMR(amr_file)
-        neighborhood_file, nodes_info_file = find_corrsponding_seq_path_file(
-            restricted_amr_name,
-            neighborhood_files,
-            nodes_info_files,
-            params.neighbourhood_length,
-        )
+        raise SarandPipelineError("No file containing path info for neighborhood sequences is available!")
+
+    base_annotate_dir = _base_annotate_dir(params.output_dir, params.neighbourhood_length)
+    neighborhood_file_index = index_seq_path_files(neighborhood_files)
+    nodes_info_file_index = index_seq_path_files(nodes_info_files)
+    # the files are indexed by the sequence length as it appears in their name
+    seq_length_key = str(params.neighbourhood_length)
+    amr_infos = []
+    for amr_file, restricted_amr_name, amr_name in amr_file_infos:
+        file_key = (restricted_amr_name, seq_length_key)
+        neighborhood_file = neighborhood_file_index.get(file_key, -1)
+        nodes_info_file = nodes_info_file_index.get(file_key, -1)
         if neighborhood_file == -1:
             LOG.error(
                 "no sequence file for "
@@ -967,23 +1237,45 @@ def seq_annotation_main(params, seq_files, path_info_files, amr_files, debug: bo
                 + " was found! We looked for a file like "
                 + restricted_amr_name
             )
-            import pdb
-
-            pdb.set_trace()
-            sys.exit(1)
-        all_seq_info_list, annotation_file = neighborhood_annotation(
-            amr_name,
-            neighborhood_file,
-            nodes_info_file,
+            raise SarandPipelineError("No sequence file for " + amr_file + " was found!")
+        amr_infos.append(
+            (amr_name, neighborhood_file, nodes_info_file, restricted_amr_name)
+        )
+
+    # with at least as many AMRs as cores, annotate the AMRs in parallel (each
+    # annotating its sequences one by one), otherwise annotate the sequences of
+    # each AMR in parallel
+    if params.num_cores == 1 or len(amr_infos) < params.num_cores:
+        # identical neighborhood sequences are often extracted for several AMRs,
+        # they're only annotated once (for the first of them)
+        annotation_cache = dict()
+        results = list()
+        for amr_info in amr_infos:
+            results.append(annotate_amr_neighborhood(
+                params.neighbourhood_length,
+                params.output_dir,
+                params.no_rgi,
+                params.rgi_include_loose,
+                params.num_cores,
+                base_annotate_dir,
+                amr_info,
+                annotation_cache,
+            ))
+    else:
+        # each worker annotates the duplicate sequences of its AMR once
+        p_annotation = partial(
+            _annotate_amr_neighborhood_in_worker,
             params.neighbourhood_length,
             params.output_dir,
             params.no_rgi,
             params.rgi_include_loose,
-            "_" + restricted_amr_name,
-            params.num_cores,
+            1,
+            base_annotate_dir,
         )
-        all_seq_info_lists.append(all_seq_info_list)
-        annotation_files.append(annotation_file)
+        with Pool(params.num_cores) as p:
+            results = list(p.imap(p_annotation, amr_infos))
+    all_seq_info_lists = [all_seq_info_list for all_seq_info_list, _ in results]
+    annotation_files = [annotation_file for _, annotation_file in results]
 
     if debug:
         try_dump_to_disk(
@@ -994,6 +1286,34 @@ def seq_annotation_main(params, seq_files, path_info_files, amr_files, debug: bo
     return all_seq_info_lists, annotation_files
 
 
+def _gfa_temp_dir(gfa_file):
+    """
+    To return the directory used for the temporary copy of the GFA file: the
+    in-memory /dev/shm if it has room for it, otherwise the default one (None)
+    """
+    try:
+        if shutil.disk_usage(_SHM_DIR).free > 2 * os.path.getsize(gfa_file):
+            return _SHM_DIR
+    except OSError:
+        pass
+    return None
+
+
+def _init_extraction_worker(extraction_args):
+    """
+    To initialise an extraction worker: store the arguments of
+    neighborhood_sequence_extraction shared by all AMRs and load the graph
+    """
+    global _EXTRACTION_ARGS
+    _EXTRACTION_ARGS = extraction_args
+    preload_gfa(extraction_args[0])
+
+
+def _extract_neighborhood_in_worker(amr_seq_align_info):
+    """To extract the neighborhood of an AMR in an extraction worker"""
+    return neighborhood_sequence_extraction(*_EXTRACTION_ARGS, amr_seq_align_info)
+
+
 def sequence_neighborhood_main(
         params,
         gfa_file,
@@ -1011,60 +1331,70 @@ def sequence_neighborhood_main(
         the list of files containing extracted sequence and the details of nodes representing them
     """
 
-    # seq_files = []
-    # path_info_files = []
+    seq_files = []
+    path_info_files = []
     LOG.info(f"Extracting neighborhood sequences with length = {params.neighbourhood_length}")
 
     # remove paths from GFA file
     # AM: We don't want to modify the users input data so this now goes to a new file
     """
     AM: Since we don't want to modify the users input data, this is now being written
-    to a new file in the output directory. This could be in a temporary directory
-    instead.
+    to a new file in a temporary directory (in memory if there's room for it), which
+    is removed once the sequences are extracted.
     """
-    path_gfa_new = Path(params.output_dir) / f'{gfa_file.stem}_no_paths.gfa'
-    delete_lines_started_with("P", gfa_file, path_gfa_new)
-    gfa_file = path_gfa_new
+    with tempfile.TemporaryDirectory(dir=_gfa_temp_dir(gfa_file)) as tmp_dir:
+        path_gfa_new = Path(tmp_dir) / f'{gfa_file.stem}_no_paths.gfa'
+        delete_lines_started_with("P", gfa_file, path_gfa_new)
+        gfa_file = path_gfa_new
 
-    sequence_dir = os.path.join(
-        params.output_dir,
-        SEQ_DIR_NAME,
-        f'{SEQ_DIR_NAME}_{params.neighbourhood_length}',
-    )
-    os.makedirs(sequence_dir, exist_ok=True)
-
-    # If running single threaded do not add any overhead using multiprocessing pool
-    if params.num_cores == 1:
-        lists = list()
-        for x in amr_seq_align_info:
-            lists.append(neighborhood_sequence_extraction(gfa_file,
-                                                          params.neighbourhood_length,
-                                                          sequence_dir,
-                                                          params.min_target_identity,
-                                                          SEQ_NAME_PREFIX,
-                                                          1000,  # should this really be an option? path_node_threshold
-                                                          params.max_kmer_size,
-                                                          params.extraction_timeout,
-                                                          params.assembler, x))
-    else:
-        p_extraction = partial(
-            neighborhood_sequence_extraction,
-            gfa_file,
-            params.neighbourhood_length,
-            sequence_dir,
-            params.min_target_identity,
-            SEQ_NAME_PREFIX,
-            1000,  # should this really be an option? path_node_threshold
-            params.max_kmer_size,
-            params.extraction_timeout,
-            params.assembler
+        sequence_dir = os.path.join(
+            params.output_dir,
+            SEQ_DIR_NAME,
+            f'{SEQ_DIR_NAME}_{params.neighbourhood_length}',
         )
-        with Pool(params.num_cores) as p:
-            lists = list(p.imap(p_extraction, amr_seq_align_info))
-    seq_files, path_info_files = zip(*lists)
-
-    # AM: To clean up the file we created earlier
-    os.remove(path_gfa_new)
+        ensure_dir(sequence_dir)
+
+        # If running single threaded do not add any overhead using multiprocessing pool
+        if params.num_cores == 1:
+            for x in amr_seq_align_info:
+                seq_file, path_info_file = neighborhood_sequence_extraction(gfa_file,
+                                                                            params.neighbourhood_length,
+                                                                            sequence_dir,
+                                                                            params.min_target_identity,
+                                                                            SEQ_NAME_PREFIX,
+                                                                            1000,  # should this really be an option? path_node_threshold
+                                                                            params.max_kmer_size,
+                                                                            params.extraction_timeout,
+                                                                            params.assembler, x)
+                seq_files.append(seq_file)
+                path_info_files.append(path_info_file)
+        else:
+            # the arguments shared by all AMRs are sent to each worker once when it
+            # starts (and the graph is loaded then), only the AMR is sent per task
+            extraction_args = (
+                str(gfa_file),
+                params.neighbourhood_length,
+                sequence_dir,
+                params.min_target_identity,
+                SEQ_NAME_PREFIX,
+                1000,  # should this really be an option? path_node_threshold
+                params.max_kmer_size,
+                params.extraction_timeout,
+                params.assembler
+            )
+            chunksize = max(1, len(amr_seq_align_info) // (params.num_cores * 4))
+            with ProcessPoolExecutor(
+                    max_workers=params.num_cores,
+                    initializer=_init_extraction_worker,
+                    initargs=(extraction_args,),
+            ) as executor:
+                for seq_file, path_info_file in executor.map(
+                        _extract_neighborhood_in_worker, amr_seq_align_info, chunksize=chunksize
+                ):
+                    seq_files.append(seq_file)
+                    path_info_files.append(path_info_file)
+        # the graph loaded in this process (if single threaded) is no longer needed
+        clear_gfa_cache()
 
     if debug:
         try_dump_to_disk(
@@ -1102,9 +1432,7 @@ def full_pipeline_main(params):
 
     if not unique_amr_files:
         LOG.error("No AMR genes were found in graph!")
-        import pdb
-        pdb.set_trace()
-        sys.exit(1)
+        raise SarandPipelineError("No AMR genes were found in graph!")
 
     # not used anywhere? @Somayeh
     send_amr_align_info = False
@@ -1112,14 +1440,10 @@ def full_pipeline_main(params):
         send_amr_align_info = True
     else:
         LOG.error("AMR alignment info is not available")
-        import pdb
-
-        pdb.set_trace()
+        raise SarandPipelineError("AMR alignment info is not available")
 
     # create pairs of seq and align info
-    amr_seq_align_info = []
-    for i, amr_file in enumerate(unique_amr_files):
-        amr_seq_align_info.append((amr_file, unique_amr_path_list[i]))
+    amr_seq_align_info = list(zip(unique_amr_files, unique_amr_path_list))
 
     seq_files, path_info_files = sequence_neighborhood_main(
         params,
@@ -1128,12 +1452,14 @@ def full_pipeline_main(params):
         params.debug
     )
 
+    # the AMR files are only read once for both annotation steps
+    amr_file_infos = read_amr_file_infos(unique_amr_files)
     all_seq_info_lists, annotation_file_list = seq_annotation_main(
-        params, seq_files, path_info_files, unique_amr_files, params.debug
+        params, seq_files, path_info_files, amr_file_infos, params.debug
     )
     # never used? @Somayeh
     coverage_annotation_list = seq_annotation_trim_main(
-        params, unique_amr_files, all_seq_info_lists, annotation_file_list, True
+        params, amr_file_infos, all_seq_info_lists, annotation_file_list, True
     )
 
     LOG.info("Sarand ran successfully")
@@ -1141,7 +1467,7 @@ def full_pipeline_main(params):
 
 def get_unique_amr_info(
         d_amr_to_path_list: Dict[str, List[Dict[str, Any]]],
-        d_amr_to_seq: Dict[str, FastaSeq]
+        amr_records: List[AmrRecord]
 ):
     """Get the unique AMR sequences and their corresponding paths."""
 
@@ -1155,31 +1481,36 @@ def get_unique_amr_info(
     unique_amr_seqs = []
     unique_amr_infos = []
     unique_amr_paths: List[List[Dict[str, Any]]] = []
-
-    for amr_name, fasta_seq in d_amr_to_seq.items():
-        restricted_amr_name = restricted_amr_name_from_modified_name(amr_name)
-        if restricted_amr_name not in d_amr_to_path_list:
-            continue
-        amr_id = fasta_seq.fasta_id
-        amr_seq = fasta_seq.seq
-        path_info = d_amr_to_path_list[restricted_amr_name]
-
+    # unique_amr_paths indexed by nodes and orientations, extended as groups are added
+    unique_amr_paths_by_nodes = dict()
+
+    # the AMRs found in the graph (in the input order) with their paths
+    found_amrs = []
+    for record in amr_records:
+        path_info = d_amr_to_path_list.get(record.restricted_name)
+        if path_info is not None:
+            found_amrs.append((record, path_info))
+
+    for record, path_info in found_amrs:
+        amr_name, amr_seq = record.name, record.seq
         overlap, amr_ids = amr_path_overlap(
             found_amr_paths=unique_amr_paths,
             new_paths=path_info,
-            new_amr_len=len(amr_seq)  # AM: no longer -1 as seq not ending with '\n'
+            new_amr_len=record.length,  # AM: no longer -1 as seq not ending with '\n'
+            paths_by_nodes=unique_amr_paths_by_nodes,
         )
         if not overlap:
             unique_amr_seqs.append(amr_seq)
-            amr_info = {"name": amr_id, "overlap_list": []}
+            amr_info = {"name": record.fasta_id, "overlap_list": []}
             unique_amr_infos.append(amr_info)
+            index_amr_paths(unique_amr_paths_by_nodes, len(unique_amr_paths), path_info)
             unique_amr_paths.append(path_info)
         else:
             if len(amr_ids) > 1:
                 LOG.error("an AMR has overlap with more than one group")
-                import pdb
-
-                pdb.set_trace()
+                raise SarandPipelineError(
+                    amr_name + " has overlap with more than one group"
+                )
             # add this AMR to the right group of AMRs all having overlaps
             # AM: This will only ever iterate once, or never.
             for cur_id in amr_ids:
@@ -1195,28 +1526,23 @@ def write_found_amrs_to_disk(
         unique_amr_infos
 ):
     amr_dir = output_dir / AMR_DIR_NAME / AMR_SEQ_DIR
-    os.makedirs(amr_dir, exist_ok=True)
+    ensure_dir(amr_dir)
     overlap_file_name = output_dir / AMR_DIR_NAME / AMR_OVERLAP_FILE
 
+    amr_dir_str = str(amr_dir.absolute())
     unique_amr_files = list()
-
+    overlap_lines = list()
+    for seq, amr_info in zip(unique_amr_seqs, unique_amr_infos):
+        amr_name = amr_name_from_comment(amr_info["name"])
+        restricted_amr_name = restricted_amr_name_from_modified_name(amr_name)
+        amr_file = create_fasta_file(
+            seq,
+            amr_dir_str,
+            f'>{amr_info["name"]}',
+            restricted_amr_name
+        )
+        unique_amr_files.append(amr_file)
+        overlap_lines.append(amr_name + ":" + ", ".join(amr_info["overlap_list"]) + "\n")
     with overlap_file_name.open('w') as f:
-        for i, seq in enumerate(unique_amr_seqs):
-            amr_name = amr_name_from_comment(unique_amr_infos[i]["name"])
-            restricted_amr_name = restricted_amr_name_from_modified_name(amr_name)
-            amr_file = create_fasta_file(
-                seq,
-                str(amr_dir.absolute()),
-                f'>{unique_amr_infos[i]["name"]}',
-                restricted_amr_name
-            )
-            unique_amr_files.append(amr_file)
-            f.write(amr_name + ":")
-            if unique_amr_infos[i]["overlap_list"]:
-                f.write(
-                    ", ".join(e for e in unique_amr_infos[i]["overlap_list"])
-                )
-                f.write("\n")
-            else:
-                f.write("\n")
+        f.writelines(overlap_lines)
     return unique_amr_files
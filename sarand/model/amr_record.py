@@ -0,0 +1,20 @@
+from sarand.model.fasta_seq import FastaSeq
+
+
+class AmrRecord(FastaSeq):
+    """An AMR sequence from the input fasta file, with its derived names."""
+
+    __slots__ = ('name', 'restricted_name', 'length')
+
+    def __init__(self, seq: str, fasta_id: str, name: str, restricted_name: str):
+        """
+        Parameters:
+            seq: The sequence.
+            fasta_id: The id in the fasta file.
+            name: The AMR name, modified from the fasta id.
+            restricted_name: The name used in GraphAligner output files.
+        """
+        super().__init__(seq, fasta_id)
+        self.name: str = name
+        self.restricted_name: str = restricted_name
+        self.length: int = len(seq)
@@ -0,0 +1,74 @@
+from typing import Any, Dict, Optional
+
+
+class GeneInfo:
+    """The annotation of a gene found in an extracted neighborhood sequence."""
+
+    __slots__ = (
+        'locus_tag',
+        'gene',
+        'length',
+        'product',
+        'start_pos',
+        'end_pos',
+        'RGI_prediction_type',
+        'coverage',
+        'family',
+        'seq_value',
+        'seq_name',
+        'target_amr',
+    )
+
+    def __init__(
+            self,
+            locus_tag: Optional[str],
+            gene: str,
+            length: str,
+            product: str,
+            start_pos: int,
+            end_pos: int,
+            RGI_prediction_type: Optional[str] = None,
+            coverage: Optional[float] = None,
+            family: Optional[str] = None,
+            seq_value: Optional[str] = None,
+            seq_name: Optional[str] = None,
+            target_amr: Optional[str] = None,
+    ):
+        """
+        Parameters:
+            locus_tag: The locus tag assigned by the annotation tool.
+            gene: The gene name ('' if unknown).
+            length: The length of the gene.
+            product: The product of the gene.
+            start_pos: The start position of the gene in the sequence.
+            end_pos: The end position of the gene in the sequence.
+            RGI_prediction_type: The RGI prediction type (if found by RGI).
+            coverage: The coverage of the gene.
+            family: The AMR gene family (if found by RGI).
+            seq_value: The sequence the gene was annotated in.
+            seq_name: The name of the sequence the gene was annotated in.
+            target_amr: 'yes' if this gene is the target AMR.
+        """
+        self.locus_tag: Optional[str] = locus_tag
+        self.gene: str = gene
+        self.length: str = length
+        self.product: str = product
+        self.start_pos: int = start_pos
+        self.end_pos: int = end_pos
+        self.RGI_prediction_type: Optional[str] = RGI_prediction_type
+        self.coverage: Optional[float] = coverage
+        self.family: Optional[str] = family
+        self.seq_value: Optional[str] = seq_value
+        self.seq_name: Optional[str] = seq_name
+        self.target_amr: Optional[str] = target_amr
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.to_dict()!r})'
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the annotation as a dictionary (e.g. to dump it to JSON)."""
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def copy(self) -> 'GeneInfo':
+        """Return a shallow copy of the annotation."""
+        return self.__class__(*(getattr(self, k) for k in self.__slots__))
@@ -1,15 +1,131 @@
+import atexit
 import json
+import os
+import shutil
+import threading
+import time
 from pathlib import Path
+from typing import Iterable, Iterator, Tuple
 
 from sarand.util.logger import LOG
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# whitespace removed from sequence lines, as per Bio.SeqIO
+_FASTA_WHITESPACE = str.maketrans('', '', ' \t\r\n')
+
+# the threads deleting directories in the background, joined at exit
+_REMOVAL_THREADS = list()
+
+
+def _json_default(obj):
+    """Convert the objects JSON can't serialize (paths, numpy arrays, models)."""
+    if isinstance(obj, os.PathLike):
+        return os.fspath(obj)
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if hasattr(obj, '__slots__'):
+        return {k: getattr(obj, k) for k in obj.__slots__}
+    if hasattr(obj, '__dict__'):
+        return vars(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
 
 def try_dump_to_disk(obj, path: Path):
     """Dump a JSON serializable object to disk (for debugging)"""
     LOG.debug(f'Dumping object to disk: {path.absolute()}')
     try:
-        with open(path, 'w') as f:
-            json.dump(obj, f, indent=2)
+        # orjson is optional, it's much faster for large objects
+        if orjson is not None:
+            path.write_bytes(orjson.dumps(
+                obj,
+                default=_json_default,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+            ))
+        else:
+            with open(path, 'w') as f:
+                json.dump(obj, f, indent=2, default=_json_default)
     except Exception as e:
         LOG.error(f'Failed to dump object to disk: {e}')
     return
+
+
+def try_dump_jsonl_to_disk(records: Iterable, path: Path):
+    """Dump JSON serializable records to disk, one per line (for debugging).
+
+    Each record is written as it's encoded, so the whole output is never held
+    in memory at once.
+    """
+    LOG.debug(f'Dumping records to disk: {path.absolute()}')
+    try:
+        with open(path, 'wb') as f:
+            for record in records:
+                if orjson is not None:
+                    f.write(orjson.dumps(
+                        record,
+                        default=_json_default,
+                        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+                    ))
+                else:
+                    f.write(json.dumps(record, default=_json_default).encode())
+                    f.write(b'\n')
+    except Exception as e:
+        LOG.error(f'Failed to dump records to disk: {e}')
+    return
+
+
+def iter_fasta(path: Path) -> Iterator[Tuple[str, str]]:
+    """Yield the (description, sequence) of each record in a FASTA file.
+
+    This gives the same description and sequence as Bio.SeqIO.parse(path, "fasta")
+    without creating a SeqRecord for each record.
+    """
+    description = None
+    lines = list()
+    with open(path, buffering=1 << 20) as f:
+        for line in f:
+            if line[0] == '>':
+                if description is not None:
+                    yield description, ''.join(lines).translate(_FASTA_WHITESPACE)
+                description = line[1:].rstrip()
+                lines = list()
+            elif description is not None:
+                lines.append(line)
+            elif line.strip():
+                raise ValueError(f'Expected a FASTA header at the start of {path}')
+    if description is not None:
+        yield description, ''.join(lines).translate(_FASTA_WHITESPACE)
+
+
+def ensure_dir(path):
+    """Create a directory (and its parents) if it doesn't exist."""
+    os.makedirs(path, exist_ok=True)
+
+
+def remove_dir_in_background(path: Path):
+    """Move a directory out of the way and delete it in a background thread.
+
+    The directory is renamed to a sibling first, so its path can be re-used as
+    soon as this returns. Any pending deletions are waited for at exit.
+    """
+    stale = path.with_name(f'{path.name}.stale.{os.getpid()}.{time.time_ns()}')
+    path.rename(stale)
+    thread = threading.Thread(
+        target=shutil.rmtree, args=(stale,), kwargs={'ignore_errors': True}, daemon=True
+    )
+    thread.start()
+    _REMOVAL_THREADS.append(thread)
+
+
+def join_dir_removals():
+    """Wait for the directories being deleted in the background."""
+    while _REMOVAL_THREADS:
+        _REMOVAL_THREADS.pop().join()
+
+
+atexit.register(join_dir_removals)
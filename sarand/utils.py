@@ -13,26 +13,28 @@ import re
 import shutil
 import sys
 import tempfile
+from functools import lru_cache
 from pathlib import Path
 from typing import List, Dict, Any
 
-from Bio import SeqIO
-
 from sarand.config import PROGRAM_VERSION_NA
+from sarand.exceptions import SarandPipelineError
 from sarand.external.bakta import Bakta
 from sarand.external.blastn import Blastn
 from sarand.external.graph_aligner import GraphAligner, GraphAlignerResult
 from sarand.external.rgi import Rgi
-from sarand.model.fasta_seq import FastaSeq
-from sarand.util.file import try_dump_to_disk
+from sarand.model.amr_record import AmrRecord
+from sarand.util.file import try_dump_to_disk, iter_fasta, ensure_dir
 from sarand.util.logger import LOG
 
 
+@lru_cache(maxsize=None)
 def extract_name_from_file_name(file_name):
     """ """
     return os.path.splitext(os.path.basename(file_name))[0]
 
 
+@lru_cache(maxsize=None)
 def amr_name_from_comment(amr_comment):
     """ """
     amr_name = (
@@ -53,6 +55,7 @@ AM: This method is not used.
 #     return amr_title.strip().replace(" ", "_").replace("'", ";").replace("/", "]")
 
 
+@lru_cache(maxsize=None)
 def restricted_amr_name_from_modified_name(amr_name):
     """ """
     amr_name1 = amr_name.replace(";", "SS")
@@ -82,15 +85,14 @@ def create_fasta_file(seq, output_dir, comment="> sequence:\n", file_name="temp"
         the address of the fasta file
     """
     myfile_name = os.path.join(output_dir, file_name + ".fasta")
-    if os.path.isfile(myfile_name):
-        os.remove(myfile_name)
+    # opening with "w" truncates any existing file
     with open(myfile_name, 'w') as myfile:
-        myfile.write(comment)
-        if not comment.endswith("\n"):
-            myfile.write("\n")
-        myfile.write(seq)
-        if not seq.endswith("\n"):
-            myfile.write("\n")
+        myfile.write(
+            comment
+            + ("" if comment.endswith("\n") else "\n")
+            + seq
+            + ("" if seq.endswith("\n") else "\n")
+        )
     return myfile_name
 
 
@@ -102,14 +104,8 @@ def retrieve_AMR(file_path):
     Return:
         the sequence of the AMR gene in lower case
     """
-    amr_name = ""
-    with open(file_path) as fp:
-        for i, line in enumerate(fp):
-            # skip comment line
-            if line.startswith(">"):
-                amr_name = amr_name_from_comment(line[:-1])
-                continue
-            return line, amr_name
+    for description, seq in iter_fasta(file_path):
+        return seq, amr_name_from_comment(description)
 
 
 def reverse_sign(sign):
@@ -224,7 +220,7 @@ def run_RGI(
         the list of extracted annotation information for the sequence
     """
     rgi_dir = os.path.join(output_dir, "rgi_dir")
-    os.makedirs(rgi_dir, exist_ok=True)
+    ensure_dir(rgi_dir)
 
     output_file_name = os.path.join(
         rgi_dir,
@@ -243,10 +239,12 @@ def run_RGI(
     )
 
     # delete temp files
-    if delete_rgi_files and os.path.isfile(output_file_name + ".txt"):
-        os.remove(output_file_name + ".txt")
-    if delete_rgi_files and os.path.isfile(output_file_name + ".json"):
-        os.remove(output_file_name + ".json")
+    if delete_rgi_files:
+        for ext in (".txt", ".json"):
+            try:
+                os.remove(output_file_name + ext)
+            except FileNotFoundError:
+                pass
 
     return rgi.result.data
 
@@ -258,6 +256,7 @@ def annotate_sequence(
         no_RGI=False,
         RGI_include_loose=False,
         delete_prokka_dir=False,
+        threads=None,
 ):
     """
     To run Prokka for a sequence and extract required information from its
@@ -267,6 +266,7 @@ def annotate_sequence(
         seq_description: a small description of the sequence used for naming
         output_dir:  the path for the output directory
         no_RGI:	RGI annotations incorporated for AMR annotation
+        threads: the number of threads used by Bakta (None: all available CPUs)
     Return:
         the list of extracted annotation information for the sequence
     """
@@ -295,13 +295,14 @@ def annotate_sequence(
             genome=Path(seq_file_name),
             prefix=prefix_name,
             out_dir=Path(output_dir) / prokka_dir,
+            threads=threads,
         )
 
     # This re-appends the sequence as per the original implementation, however
     # this could be extracted from the JSON
     seq_info = ba.result.get_for_sarand()
     for seq_info_new_item in seq_info:
-        seq_info_new_item['seq_value'] = seq[:-1]
+        seq_info_new_item.seq_value = seq
 
     RGI_output_list = None
     if not no_RGI:
@@ -315,13 +316,15 @@ def annotate_sequence(
 
     # incorporate RGI findings into Prokka's
     if RGI_output_list:
+        gene_info_by_locus = dict()
+        for gene_info in seq_info:
+            gene_info_by_locus.setdefault(gene_info.locus_tag, gene_info)
         for item in RGI_output_list:
-            for gene_info in seq_info:
-                if item["ORF_ID"].split(" ")[0] == gene_info["locus_tag"]:
-                    gene_info["gene"] = item["gene"]
-                    gene_info["RGI_prediction_type"] = item["prediction_type"]
-                    gene_info["family"] = item["family"]
-                    break
+            gene_info = gene_info_by_locus.get(item["ORF_key"])
+            if gene_info is not None:
+                gene_info.gene = item["gene"]
+                gene_info.RGI_prediction_type = item["prediction_type"]
+                gene_info.family = item["family"]
 
     # remove temporary files and folder
     # if os.path.isfile(seq_file_name):
@@ -354,17 +357,16 @@ def split_up_down_info(sequence, seq_info):
         amr_end = len(sequence) - 1
     elif amr_end == -1 or amr_start == -1:
         LOG.error("No AMR sequence (lower case string) was found in " + sequence)
-        import pdb
-
-        pdb.set_trace()
-    # import pdb;pdb.set_trace()
+        raise SarandPipelineError(
+            "No AMR sequence (lower case string) was found in " + sequence
+        )
     # find the gene has the most overlap with the found range
     overlap_thr = 50
     found = False
     amr_info = []
     for gene_info in seq_info:
-        start, end = min(gene_info["start_pos"], gene_info["end_pos"]), max(
-            gene_info["start_pos"], gene_info["end_pos"]
+        start, end = min(gene_info.start_pos, gene_info.end_pos), max(
+            gene_info.start_pos, gene_info.end_pos
         )
         if end < amr_start:
             up_info.append(gene_info)
@@ -375,7 +377,7 @@ def split_up_down_info(sequence, seq_info):
             diff = max((amr_start + 1 - start), 0) + max((end - (amr_end + 1)), 0)
             if ((1 - (float(diff) / (end - start))) * 100) > overlap_thr:
                 found = True
-                gene_info["target_amr"] = "yes"
+                gene_info.target_amr = "yes"
                 amr_info = gene_info
             elif start < amr_start:
                 up_info.append(gene_info)
@@ -446,9 +448,10 @@ def compare_two_sequences(
             raise NotImplemented('Unable to return file.')
             # return blast_file_name
 
+        subject_len = len(subject)
         for row in blastn.results:
             identity = int(row.pident)
-            coverage = int(row.length / len(subject) * 100)
+            coverage = int(row.length / subject_len * 100)
             q_coverage = row.qcovhsp
 
             if subject_coverage and identity >= threshold and coverage >= threshold:
@@ -462,16 +465,16 @@ def unnamed_genes_are_siginificantly_similar(
         gene_info1, gene_info2, output_dir, threshold=90
 ):
     """ """
-    if gene_info1["gene"] != "" or gene_info2["gene"] != "":
+    if gene_info1.gene != "" or gene_info2.gene != "":
         return False
-    start1, end1 = min(gene_info1["start_pos"], gene_info1["end_pos"]), max(
-        gene_info1["start_pos"], gene_info1["end_pos"]
+    start1, end1 = min(gene_info1.start_pos, gene_info1.end_pos), max(
+        gene_info1.start_pos, gene_info1.end_pos
     )
-    seq1 = gene_info1["seq_value"][start1 - 1: end1 - 1]
-    start2, end2 = min(gene_info2["start_pos"], gene_info2["end_pos"]), max(
-        gene_info2["start_pos"], gene_info2["end_pos"]
+    seq1 = gene_info1.seq_value[start1 - 1: end1 - 1]
+    start2, end2 = min(gene_info2.start_pos, gene_info2.end_pos), max(
+        gene_info2.start_pos, gene_info2.end_pos
     )
-    seq2 = gene_info2["seq_value"][start2 - 1: end2 - 1]
+    seq2 = gene_info2.seq_value[start2 - 1: end2 - 1]
     return compare_two_sequences(seq1, seq2, output_dir, threshold)
 
 
@@ -482,9 +485,9 @@ def seqs_annotation_are_identical(seq_info1, seq_info2, out_dir, threshold=90):
         for i, gene_info1 in enumerate(seq_info1):
             gene_info2 = seq_info2[i]
             if (
-                    gene_info1["gene"] == gene_info2["gene"] and gene_info1["gene"] != ""
+                    gene_info1.gene == gene_info2.gene and gene_info1.gene != ""
             ) or (
-                    gene_info1["gene"] == gene_info2["gene"]
+                    gene_info1.gene == gene_info2.gene
                     and unnamed_genes_are_siginificantly_similar(
                 gene_info1, gene_info2, out_dir, threshold
             )
@@ -495,6 +498,18 @@ def seqs_annotation_are_identical(seq_info1, seq_info2, out_dir, threshold=90):
     return False
 
 
+def seq_annotation_genes(seq_info_list):
+    """
+    To return the gene names of an annotated sequence; only sequences with the
+    same gene names can be identical in seqs_annotation_are_identical
+    Parameters:
+        seq_info_list: list of annotations of the sequence
+    Return:
+        the tuple of gene names in the order they are annotated
+    """
+    return tuple(gene_info.gene for gene_info in seq_info_list)
+
+
 def similar_seq_annotation_already_exist(
         seq_info_list, all_seq_info_lists, out_dir, threshold=90
 ):
@@ -632,10 +647,17 @@ def read_path_info_from_align_file_with_multiple_amrs(
 
     paths_info_list = collections.defaultdict(list)
     for result in ga:
-        amr_name = result.amr_name
         coverage = result.coverage_pct
         identity = result.identity_pct
 
+        # AM: Removed the cast to integer before comparison
+        passed = coverage >= threshold and identity >= threshold
+
+        # The AMR name is only needed for hits that are kept (or for debugging)
+        if not passed and not debug:
+            continue
+        amr_name = result.amr_name
+
         # Append debugging information
         if debug:
             debug_to_write.append({
@@ -646,8 +668,7 @@ def read_path_info_from_align_file_with_multiple_amrs(
                 'identity': identity
             })
 
-        # AM: Removed the cast to integer before comparison
-        if coverage >= threshold and identity >= threshold:
+        if passed:
             nodes, orientation_list = result.path_to_sarand
             """
             AM: start_pos has been incremented by one to compensate for exclusive bounds
@@ -669,7 +690,8 @@ def read_path_info_from_align_file_with_multiple_amrs(
             debug_to_write,
             output_name / 'debug_graph_aligner_coverage_identity.json'
         )
-    return paths_info_list
+    # a plain dict, so that looking up an AMR without paths doesn't silently add it
+    return dict(paths_info_list)
 
 
 """
@@ -719,19 +741,47 @@ AM: This method is not called anywhere.
 #     return unique_amr_path_list
 
 
+# the size of the chunks read by delete_lines_started_with
+_LINE_FILTER_CHUNK_SIZE = 1 << 22
+
+
 def delete_lines_started_with(ch, filename: Path, out_path: Path):
     """
     To delete all the lines in a text file that starts with a given character
     Parameters:
         ch: the character
         filename: the text file
+        out_path: the file the remaining lines are written to
     """
     # command = "sed -i '/^P/d' " + file_name
     # os.system(command)
-    with filename.open() as f_in, out_path.open('w') as f_out:
-        for line in f_in.readlines():
-            if not line.startswith(ch):
-                f_out.write(line)
+    prefix = ch.encode()
+    buf = bytearray()
+    with filename.open('rb') as f_in, out_path.open('wb') as f_out:
+        while True:
+            chunk = f_in.read(_LINE_FILTER_CHUNK_SIZE)
+            if chunk:
+                buf += chunk
+                # only the complete lines are filtered, the rest is kept for the next chunk
+                end = buf.rfind(b'\n')
+                if end == -1:
+                    continue
+            else:
+                end = len(buf)
+                if end == 0:
+                    break
+            kept = [
+                line for line in bytes(buf[:end]).split(b'\n')
+                if not line.startswith(prefix)
+            ]
+            if kept:
+                f_out.write(b'\n'.join(kept))
+                # the last line of the file may not end with a newline
+                if chunk:
+                    f_out.write(b'\n')
+            del buf[:end + 1]
+            if not chunk:
+                break
 
 
 """
@@ -823,16 +873,19 @@ def validate_range(value_type, minimum, maximum):
     return range_checker
 
 
-def extract_amr_sequences(path: Path) -> Dict[str, FastaSeq]:
-    """Extract the AMR sequences from a FASTA file."""
-    out = dict()
-    with path.open() as f:
-        for record in SeqIO.parse(f, "fasta"):
-            amr_name = amr_name_from_comment(record.description)
-            if amr_name in out:
-                raise ValueError(f"Duplicate AMR name {amr_name} in {path}")
-            out[amr_name] = FastaSeq(
-                seq=str(record.seq),
-                fasta_id=str(record.description)
-            )
+def extract_amr_sequences(path: Path) -> List[AmrRecord]:
+    """Extract the AMR sequences from a FASTA file, in file order."""
+    out = list()
+    seen = set()
+    for description, seq in iter_fasta(path):
+        amr_name = amr_name_from_comment(description)
+        if amr_name in seen:
+            raise ValueError(f"Duplicate AMR name {amr_name} in {path}")
+        seen.add(amr_name)
+        out.append(AmrRecord(
+            seq=seq,
+            fasta_id=description,
+            name=amr_name,
+            restricted_name=restricted_amr_name_from_modified_name(amr_name)
+        ))
     return out